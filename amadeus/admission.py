@@ -0,0 +1,215 @@
+import time
+from typing import Any, Dict, Hashable, List, NamedTuple, Optional
+
+import discord
+
+from .metrics import Registry
+
+
+class Limit(NamedTuple):
+    """
+    A token bucket: up to burst at once, refilling at rate per second.
+    """
+    rate: float
+    burst: float
+
+
+# /dc starts a process, so it gets a tighter limit unless told otherwise
+DEFAULT_COMMAND_LIMITS = {"dc": Limit(0.2, 2)}
+
+
+class Buckets:
+    """
+    A token bucket for each key (e.g. each user), all with the same limit.
+    Buckets are only kept while they aren't full, so idle keys don't take up memory.
+    """
+
+    # how many buckets there can be before full ones are looked for and dropped
+    PRUNE_AT = 4096
+
+    def __init__(self, limit: Limit):
+        """
+        Creates a new Buckets
+        :param limit: The limit for every bucket.
+        """
+        self.limit = limit
+        # key -> [tokens, when they were last topped up]
+        self.buckets: Dict[Hashable, List[float]] = {}
+
+    def _tokens(self, key: Hashable, now: float) -> List[float]:
+        bucket = self.buckets.get(key)
+
+        if bucket is None:
+            if len(self.buckets) >= self.PRUNE_AT:
+                self.prune(now)
+
+            bucket = self.buckets[key] = [self.limit.burst, now]
+        else:
+            bucket[0] = min(self.limit.burst, bucket[0] + (now - bucket[1]) * self.limit.rate)
+            bucket[1] = now
+
+        return bucket
+
+    def peek(self, key: Hashable, now: float) -> bool:
+        """
+        Checks whether a key has a token, without taking it.
+        :param key: The key.
+        :param now: The current time, from time.monotonic.
+        :return: Whether there is a token.
+        """
+        return self._tokens(key, now)[0] >= 1
+
+    def take(self, key: Hashable, now: float):
+        """
+        Takes a token from a key. This can leave the bucket in debt, if it was checked with peek first.
+        :param key: The key.
+        :param now: The current time, from time.monotonic.
+        :return: Nothing
+        """
+        self._tokens(key, now)[0] -= 1
+
+    def prune(self, now: float):
+        """
+        Drops the buckets that have filled back up.
+        :param now: The current time, from time.monotonic.
+        :return: Nothing
+        """
+        self.buckets = {
+            k: v for k, v in self.buckets.items()
+            if v[0] + (now - v[1]) * self.limit.rate < self.limit.burst
+        }
+
+
+class AdmissionController:
+    """
+    Limits how fast each user and each channel can set off responses and commands, so one person spamming
+    doesn't slow the bot down for everyone else. Anything over the limits is dropped before any work is done on it.
+
+    Every message takes a token from its author's and its channel's buckets before any trigger is looked at.
+    Responses and commands can have their own limits on top, per user.
+    """
+
+    def __init__(self, user=Limit(1, 5), channel=Limit(5, 20), command_user=Limit(0.5, 5),
+                 responses: Optional[Dict[str, Limit]] = None, commands: Optional[Dict[str, Limit]] = None,
+                 metrics: Optional[Registry] = None):
+        """
+        Creates a new AdmissionController
+        :param user: The limit on messages from each user.
+        :param channel: The limit on messages in each channel.
+        :param command_user: The limit on commands from each user.
+        :param responses: Extra limits on individual responses, per user, by response name.
+        :param commands: Extra limits on individual commands, per user, by qualified command name.
+        Defaults to DEFAULT_COMMAND_LIMITS.
+        :param metrics: The registry to count what's let through and what's dropped in. Defaults to a new one.
+        """
+        self.users = Buckets(user)
+        self.channels = Buckets(channel)
+        self.command_users = Buckets(command_user)
+        self.responses = {k.lower(): Buckets(v) for k, v in (responses or {}).items()}
+
+        if commands is None:
+            commands = DEFAULT_COMMAND_LIMITS
+        self.commands = {k: Buckets(v) for k, v in commands.items()}
+
+        metrics = metrics if metrics is not None else Registry()
+        self.admitted = metrics.counter("amadeus_admitted_total", "Messages and commands let through", ["kind"])
+        self.shed = metrics.counter("amadeus_shed_total", "Messages and commands dropped, by what limited them",
+                                    ["limit"])
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any], metrics: Optional[Registry] = None) -> "AdmissionController":
+        """
+        Creates an AdmissionController from the config, where each limit is a [rate, burst] pair, e.g.
+        {"user": [1, 5], "responses": {"hug": [0.2, 2]}, "commands": {"dc": [0.1, 2]}}
+        Anything left out keeps its default.
+        :param config: The config.
+        :param metrics: The registry to count what's let through and what's dropped in.
+        :return: The AdmissionController.
+        """
+        options = {k: Limit(*config[k]) for k in ("user", "channel", "command_user") if k in config}
+
+        if "responses" in config:
+            options["responses"] = {k: Limit(*v) for k, v in config["responses"].items()}
+
+        if "commands" in config:
+            options["commands"] = {k: Limit(*v) for k, v in config["commands"].items()}
+
+        return cls(metrics=metrics, **options)
+
+    def admit_message(self, message: discord.Message) -> bool:
+        """
+        Checks whether a message should be looked at, and takes a token for it if so.
+        :param message: The message.
+        :return: Whether to go on and check it against the responses.
+        """
+        now = time.monotonic()
+
+        if not self.users.peek(message.author.id, now):
+            self.shed.inc(limit="user")
+            return False
+
+        if not self.channels.peek(message.channel.id, now):
+            self.shed.inc(limit="channel")
+            return False
+
+        self.users.take(message.author.id, now)
+        self.channels.take(message.channel.id, now)
+        self.admitted.inc(kind="messages")
+        return True
+
+    def response_ready(self, name: str, message: discord.Message) -> bool:
+        """
+        Checks whether a response can be set off by a message's author, without using anything up.
+        This is checked once the response has matched, so a response over its limit sheds the message
+        rather than letting a later response answer it.
+        :param name: The name of the response.
+        :param message: The message.
+        :return: Whether to apply the response.
+        """
+        buckets = self.responses.get(name.lower())
+
+        if buckets is None or buckets.peek(message.author.id, time.monotonic()):
+            return True
+
+        self.shed.inc(limit=f"response {name}")
+        return False
+
+    def response_fired(self, name: str, message: discord.Message):
+        """
+        Takes a token for a response that has been set off.
+        :param name: The name of the response.
+        :param message: The message that set it off.
+        :return: Nothing
+        """
+        buckets = self.responses.get(name.lower())
+
+        if buckets is not None:
+            buckets.take(message.author.id, time.monotonic())
+
+    def admit_command(self, interaction: discord.Interaction) -> bool:
+        """
+        Checks whether a command should be run, and takes a token for it if so.
+        :param interaction: The interaction the command is being run with.
+        :return: Whether to run it.
+        """
+        now = time.monotonic()
+        user = interaction.user.id
+        name = interaction.command.qualified_name if interaction.command is not None else None
+        buckets = self.commands.get(name)
+
+        if not self.command_users.peek(user, now):
+            self.shed.inc(limit="command user")
+            return False
+
+        if buckets is not None and not buckets.peek(user, now):
+            self.shed.inc(limit=f"command /{name}")
+            return False
+
+        self.command_users.take(user, now)
+
+        if buckets is not None:
+            buckets.take(user, now)
+
+        self.admitted.inc(kind="commands")
+        return True
+
@@ -0,0 +1,218 @@
+import io
+import mmap
+import os
+import time
+from typing import Dict, List, Optional
+from urllib.parse import parse_qs, urlparse
+
+import discord
+
+
+class _MappedReader(io.RawIOBase):
+    """
+    A read-only file over a memoryview.
+    This lets discord.File upload straight out of a mapped file without copying it into a bytes object first.
+    """
+
+    def __init__(self, view: memoryview):
+        self._view = view
+        self._pos = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._pos
+
+    def seek(self, offset: int, whence=io.SEEK_SET) -> int:
+        if whence == io.SEEK_SET:
+            self._pos = offset
+        elif whence == io.SEEK_CUR:
+            self._pos += offset
+        elif whence == io.SEEK_END:
+            self._pos = len(self._view) + offset
+        else:
+            raise ValueError(f"Invalid whence {whence}")
+
+        self._pos = max(0, self._pos)
+        return self._pos
+
+    def readinto(self, b) -> int:
+        n = max(0, min(len(b), len(self._view) - self._pos))
+        b[:n] = self._view[self._pos:self._pos + n]
+        self._pos += n
+        return n
+
+    def close(self):
+        self._view.release()
+        super().close()
+
+
+class Asset:
+    """
+    A file in an AssetStore, mapped into memory, along with the CDN url of its last upload.
+    """
+
+    def __init__(self, path: str, stat: os.stat_result):
+        """
+        Creates a new Asset, mapping the file at the given path.
+        :param path: The path of the file.
+        :param stat: The result of stat-ing the file, used to tell when it changes.
+        """
+        self.path = path
+        self.name = os.path.basename(path)
+        self.size = stat.st_size
+        self.mtime_ns = stat.st_mtime_ns
+
+        with open(path, "rb") as f:
+            self.mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        self.url = None
+        self.url_expires = None
+
+    def changed(self, stat: os.stat_result) -> bool:
+        """
+        Checks whether the file has changed since it was mapped.
+        :param stat: The result of stat-ing the file now.
+        :return: Whether it has changed.
+        """
+        return stat.st_size != self.size or stat.st_mtime_ns != self.mtime_ns
+
+    def close(self):
+        """
+        Unmaps the file.
+        :return: Nothing
+        """
+        try:
+            self.mapping.close()
+        except BufferError:
+            # still being uploaded, it gets unmapped once the upload lets go of it
+            pass
+
+
+class AssetStore:
+    """
+    Serves the files in a directory as discord attachments.
+
+    Files are indexed and memory-mapped up front and uploaded straight from the mapping.
+    Once a file has been uploaded, the url discord gives it is kept and sent instead of the file,
+    until that url expires.
+    """
+
+    # how long before an attachment url expires to stop using it
+    URL_EXPIRY_MARGIN = 60 * 60
+
+    def __init__(self, directory: str):
+        """
+        Creates a new AssetStore. Nothing is indexed until scan is called.
+        :param directory: The directory to serve files from.
+        """
+        self.directory = directory
+        self.assets: Dict[str, Asset] = {}
+        self._directory_mtime_ns = None
+
+    def scan(self):
+        """
+        Indexes the directory, mapping any files that are new or changed and dropping any that are gone.
+        Files that haven't changed are left alone, along with their cached urls.
+        :return: Nothing
+        """
+        try:
+            self._directory_mtime_ns = os.stat(self.directory).st_mtime_ns
+            entries = [x for x in os.scandir(self.directory) if x.is_file()]
+        except FileNotFoundError:
+            entries = []
+
+        seen = set()
+
+        for entry in entries:
+            stat = entry.stat()
+            seen.add(entry.name)
+
+            old = self.assets.get(entry.name)
+
+            if old is not None and not old.changed(stat):
+                continue
+
+            if old is not None:
+                old.close()
+                del self.assets[entry.name]
+
+            # empty files can't be mapped, and aren't worth sending anyway
+            if stat.st_size == 0:
+                continue
+
+            self.assets[entry.name] = Asset(entry.path, stat)
+
+        for name in list(self.assets):
+            if name not in seen:
+                self.assets.pop(name).close()
+
+    def rescan_if_changed(self):
+        """
+        Rescans the directory if files have been added, removed or renamed since the last scan.
+        This is only a stat of the directory when nothing has changed.
+        :return: Nothing
+        """
+        try:
+            mtime_ns = os.stat(self.directory).st_mtime_ns
+        except FileNotFoundError:
+            mtime_ns = None
+
+        if mtime_ns != self._directory_mtime_ns:
+            self.scan()
+
+    def names(self) -> List[str]:
+        """
+        :return: The names of all the files in the store.
+        """
+        return list(self.assets)
+
+    def get(self, name: str) -> Optional[Asset]:
+        """
+        :param name: The name of the file.
+        :return: The asset, or None if there's no such file.
+        """
+        return self.assets.get(name)
+
+    def file(self, asset: Asset) -> discord.File:
+        """
+        Creates a discord.File for an asset that reads straight from its mapping.
+        :param asset: The asset.
+        :return: The file, ready to be sent.
+        """
+        return discord.File(_MappedReader(memoryview(asset.mapping)), filename=asset.name)
+
+    def cached_url(self, asset: Asset) -> Optional[str]:
+        """
+        :param asset: The asset.
+        :return: The url of the asset's last upload, or None if it hasn't been uploaded or the url is about to expire.
+        """
+        if asset.url is None:
+            return None
+
+        if asset.url_expires is not None and time.time() > asset.url_expires - self.URL_EXPIRY_MARGIN:
+            asset.url = None
+            return None
+
+        return asset.url
+
+    def remember_url(self, asset: Asset, url: str):
+        """
+        Keeps the url an asset was uploaded to, so it can be sent instead of the file next time.
+        :param asset: The asset.
+        :param url: The attachment url discord gave the upload.
+        :return: Nothing
+        """
+        # attachment urls are signed, with the expiry time as hex in the ex parameter
+        ex = parse_qs(urlparse(url).query).get("ex")
+
+        try:
+            asset.url_expires = int(ex[0], 16) if ex else None
+        except ValueError:
+            asset.url_expires = None
+
+        asset.url = url
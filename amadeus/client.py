@@ -1,95 +1,451 @@
-import pickle
-from typing import Any
+import asyncio
+import logging
+import os
+import sqlite3
+import time
+from typing import Any, Dict, List, Optional, Union
 
 import discord
 from discord import Intents
 
-from . import response, commands
+from . import response, commands, logs, memory, state
+from .admission import AdmissionController
+from .assets import AssetStore
+from .emojis import EmojiResolver
+from .lifecycle import Lifecycle
+from .replay import Recorder
+from .store import SharedStore
+from .metrics import MetricsServer, Registry
+from .watchdog import Watchdog
+
+log = logging.getLogger(__name__)
 
 
 class Amadeus(discord.Client):
     """
     The latest and greatest in Discord bottery.
     """
-    def __init__(self, *, intents: Intents, **options: Any):
+    def __init__(self, *, intents: Intents, watchdog=False, store: Optional[SharedStore] = None, offload=False,
+                 record: Optional[str] = None, admission: Optional[AdmissionController] = None,
+                 metrics: Optional[Registry] = None, metrics_port: Optional[int] = None, **options: Any):
+        """
+        Creates a new Amadeus
+        :param intents: The gateway intents to use.
+        :param watchdog: Whether to watch the event loop for blocking calls and track the heartbeat latency.
+        :param store: The store to share state through, when running shards over several processes.
+        If None, state is kept in this process and saved to a snapshot.
+        :param offload: Whether to match regexes against long messages in worker processes.
+        :param record: The path of a log to record the messages and commands seen to, for replaying later.
+        :param admission: What limits how fast users and channels can set off responses and commands, if anything.
+        :param metrics: The registry to keep metrics in. Defaults to a new one.
+        :param metrics_port: The port to serve the metrics on, for Prometheus. If None, they aren't served.
+        :param options: Any other options for discord.Client.
+        """
+        self.metrics = metrics if metrics is not None else Registry()
+        self.metrics_server = MetricsServer(self.metrics, metrics_port) if metrics_port is not None else None
+        self._register_metrics()
+
         self.click_db = {}
+        self.store = store
+        # whether the state has changed since it was last saved
+        self.state_dirty = False
+        self.lifecycle = Lifecycle(self)
+        self._responses_version = None
+        self.offload = offload
+        self.watchdog = Watchdog(self, self.metrics) if watchdog else None
+        self.forgotten_images = AssetStore("data/forgotten_images")
+        self.emoji_resolver = EmojiResolver()
+        self.admission = admission
+        self.recorder = Recorder(record, self) if record is not None else None
         super().__init__(intents=intents, **options)
 
+    def _register_metrics(self):
+        self.messages_handled = self.metrics.counter("amadeus_messages_total", "Messages looked at")
+        self.responses_fired = self.metrics.counter("amadeus_responses_fired_total", "Responses fired", ["response"])
+        self.response_latency = self.metrics.histogram(
+            "amadeus_response_seconds", "How long it took from a message coming in to its response being applied",
+            ["response"]
+        )
+        self.commands_run = self.metrics.counter("amadeus_commands_total", "Commands run", ["command"])
+        self.command_latency = self.metrics.histogram(
+            "amadeus_command_seconds", "How long commands took to complete", ["command"]
+        )
+        self.dc_runs = self.metrics.counter("amadeus_dc_runs_total", "dc processes run, by how they ended", ["outcome"])
+        self.save_latency = self.metrics.histogram("amadeus_state_save_seconds", "How long saving the state took")
+        self.save_failures = self.metrics.counter("amadeus_state_save_failures_total", "Failed saves of the state")
+
+        self.metrics.gauge("amadeus_in_flight_tasks", "Messages and commands being handled",
+                           function=lambda: len(self.lifecycle.in_flight))
+        self.metrics.gauge("amadeus_guilds", "Guilds the client is in", function=lambda: len(self.guilds))
+        self.metrics.gauge("amadeus_resident_memory_bytes", "Resident memory of this process",
+                           function=memory.resident_memory)
+        self.metrics.counter("amadeus_log_records_dropped_total", "Log records dropped because the log queue was full",
+                             function=logs.dropped_records)
+
+    async def setup_hook(self):
+        self.forgotten_images.scan()
+        self.lifecycle.install_signal_handlers()
+        self.loop.create_task(self._flush_state())
+
+        if self.watchdog is not None:
+            self.watchdog.start()
+
+        if self.store is not None:
+            self.loop.create_task(self._sync_responses())
+
+        if self.offload:
+            response.offload.enable_offloading()
+
+        if self.metrics_server is not None:
+            await self.metrics_server.start()
+
+    async def close(self):
+        self.lifecycle.accepting = False
+
+        if self.watchdog is not None:
+            self.watchdog.stop()
+
+        if self.metrics_server is not None:
+            await self.metrics_server.close()
+
+        await super().close()
+
+        self.flush_state()
+
+        if self.offload:
+            response.offload.disable_offloading()
+
+        if self.store is not None:
+            self.store.close()
+
+        if self.recorder is not None:
+            self.recorder.close()
+
+    async def _sync_responses(self, interval=5):
+        """
+        Picks up changes to the response states and toggles made by other processes.
+        :param interval: How often, in seconds, to check for changes.
+        :return: Nothing
+        """
+        while not self.is_closed():
+            await asyncio.sleep(interval)
+
+            # save local changes first, so loading another process's doesn't undo them.
+            # only what changed here is saved, so this doesn't undo another process's changes either
+            self.flush_state()
+
+            try:
+                version = self.store.responses_version()
+
+                if version != self._responses_version:
+                    self._apply_state(self.store.load_responses())
+                    self._responses_version = version
+            except sqlite3.Error as e:
+                # another process is holding the store, so check again next time
+                log.warning("Syncing responses failed: %s", e)
+
+    async def _flush_state(self, interval=30):
+        """
+        Saves the state every so often, if it's changed.
+        :param interval: How often, in seconds, to check for changes.
+        :return: Nothing
+        """
+        while not self.is_closed():
+            await asyncio.sleep(interval)
+            self.flush_state()
+
     async def on_ready(self):
-        print('Logged on as {0}!'.format(self.user))
+        log.info('Logged on as %s!', self.user)
+        log.info('%s', memory.memory_report(self))
 
+        self.emoji_resolver.rebuild(self.emojis)
+
+        # on_ready comes again after a reconnect, so save anything that would be lost by restoring over it
+        self.flush_state()
         self.retrieve_state()
 
         try:
-            tree = discord.app_commands.CommandTree(self)
+            tree = commands.AmadeusCommandTree(self)
             commands.add_commands(tree)
             await tree.sync()
         except discord.errors.ClientException:
             pass
 
+    async def on_guild_emojis_update(self, guild: discord.Guild, before, after):
+        self.emoji_resolver.update(before, after)
+
     async def on_message(self, message: discord.Message):
 
         if message.author.id == self.user.id:
             return
 
+        if not self.lifecycle.admit():
+            return
+
+        if self.recorder is not None:
+            self.recorder.record_message(message)
+
+        if self.admission is not None and not self.admission.admit_message(message):
+            return
+
+        self.messages_handled.inc()
+
+        start = time.perf_counter()
+        fired = await self.dispatch_message(message)
+
+        if fired is not None:
+            latency = time.perf_counter() - start
+
+            self.responses_fired.inc(response=fired.name)
+            self.response_latency.observe(latency, response=fired.name)
+
+            log.info("Response %s fired", fired.name, extra={
+                "event": "response",
+                "guild": message.guild.id if message.guild is not None else None,
+                "channel": message.channel.id,
+                "response": fired.name,
+                "latency": latency,
+            })
+
+    async def on_app_command_completion(self, interaction: discord.Interaction, command):
+        if "received" in interaction.extras:
+            self.command_latency.observe(time.perf_counter() - interaction.extras["received"],
+                                         command=command.qualified_name)
+
+    async def dispatch_message(self, message: discord.Message) -> Optional[response.Response]:
+        """
+        Runs a message past the responses, and applies the first one that triggers.
+        :param message: The message.
+        :return: The response that was applied, or None if none were.
+        """
+        message = response.NormalizedMessage(message)
+
         for i in response.responses:
-            if await i.check(message):
-                await i.apply(message, self)
-                break
+            if self.watchdog is not None:
+                self.watchdog.track(i.name)
+
+            if not await i.check(message):
+                continue
 
-    def retrieve_state(self, pickle_name="data.pickle"):
+            if self.admission is not None:
+                # a response over its limit still matched first, so nothing after it gets a turn either
+                if not self.admission.response_ready(i.name, message):
+                    return None
+
+                self.admission.response_fired(i.name, message)
+
+            await i.apply(message, self)
+            return i
+
+        return None
+
+    def retrieve_state(self, state_name="data.state", legacy_pickle_name="data.pickle"):
         """
-        Retrieves the state from the given pickle.
-        This is for saving settings between restarts
-        :param pickle_name: The name of the pickle to retrieve the state from
+        Retrieves the state from the given snapshot, or from the shared store if there is one.
+        This is for saving settings between restarts.
+        If there is no snapshot yet, the state is moved over from the old pickle if there is one.
+        If the shared store is empty, it's filled from the snapshot.
+        :param state_name: The name of the snapshot to retrieve the state from
+        :param legacy_pickle_name: The name of the pickle used before snapshots
         :return: Nothing
         """
 
-        print("Restoring state")
+        log.info("Restoring state")
+
+        save = self._load_snapshot(state_name, legacy_pickle_name)
 
+        if self.store is not None:
+            try:
+                if save is not None and self.store.seed(save):
+                    log.info("Filled the shared store from the snapshot")
+
+                version = self.store.responses_version()
+                save = self.store.load_responses()
+                save["click_db"] = self.store.click_db()
+                self._responses_version = version
+            except sqlite3.Error as e:
+                # the snapshot may be older than the store, so don't apply it. the responses are picked up
+                # by the next sync instead, as the version is unknown
+                log.error("Restoring from the shared store failed: %s", e)
+                self._responses_version = None
+                return
+
+        if save is not None:
+            self._apply_state(save)
+
+    @staticmethod
+    def _load_snapshot(state_name, legacy_pickle_name) -> Optional[Dict[str, Any]]:
         try:
-            with open(pickle_name, "rb") as f:
-                p = pickle.Unpickler(f)
-                save = p.load()
+            return state.load(state_name)
+        except FileNotFoundError:
+            if not os.path.exists(legacy_pickle_name):
+                log.info("No state to restore")
+                return None
+
+            log.info("Moving state over from %s", legacy_pickle_name)
+
+            try:
+                save = state.load_legacy_pickle(legacy_pickle_name)
+            except Exception as e:
+                log.error("Restoring failed: %s", e)
+                return None
+
+            state.save(state_name, save)
+            return save
+        except (OSError, state.StateError) as e:
+            log.error("Restoring failed: %s", e)
+            return None
 
+    def _apply_state(self, save: Dict[str, Any]):
+        if "responses_states" in save:
             response.set_all_states(save["responses_states"])
+
+        if "responses_enabled" in save:
             response.set_all_enabled(save["responses_enabled"])
 
+        if "click_db" in save:
             self.click_db = save["click_db"]
 
-        except Exception:
-            print("Restoring failed")
-
-    def save_state(self, pickle_name="data.pickle"):
+    def save_state(self, state_name="data.state"):
         """
-        Saves the state to the given pickle.
+        Saves the state to the given snapshot.
         This is for saving settings between restarts
-        :param pickle_name: The name of the pickle to save the state to
+        :param state_name: The name of the snapshot to save the state to
         :return: Nothing
         """
 
-        print("Saving state")
+        log.info("Saving state")
+
+        if self.store is not None:
+            if self._responses_version is None:
+                # the responses couldn't be read from the store, so saving now could undo another process's changes
+                raise sqlite3.OperationalError("the shared store hasn't been read yet")
 
-        save = {
+            # click counts are already in the store, as they're incremented there.
+            # the version isn't taken from the save, so anything another process saved alongside it still gets loaded
+            self.store.save_responses(response.get_all_states(), response.get_all_enabled())
+            return
+
+        state.save(state_name, {
             "responses_states": response.get_all_states(),
             "responses_enabled": response.get_all_enabled(),
             "click_db": self.click_db
-        }
+        })
+
+    def mark_state_dirty(self):
+        """
+        Notes that the state has changed, so it gets saved at the next flush.
+        :return: Nothing
+        """
+        self.state_dirty = True
+
+    def flush_state(self):
+        """
+        Saves the state, if it's changed since it was last saved.
+        :return: Nothing
+        """
+        if not self.state_dirty:
+            return
+
+        self.state_dirty = False
+        start = time.perf_counter()
+
+        try:
+            self.save_state()
+        except (OSError, sqlite3.Error) as e:
+            self.state_dirty = True
+            self.save_failures.inc()
+            log.error("Saving state failed: %s", e)
+        else:
+            self.save_latency.observe(time.perf_counter() - start)
+
+    def click(self, member_id: int) -> Optional[int]:
+        """
+        Adds one to the number of times a member has been clicked.
+        This is saved at the next flush, or straight away when there's a shared store.
+        :param member_id: The id of the member.
+        :return: The new number of times they've been clicked, or None if the shared store was too busy to count it.
+        """
+        if self.store is not None:
+            try:
+                times_clicked = self.store.increment_click(member_id)
+            except sqlite3.OperationalError as e:
+                log.warning("Counting a click failed: %s", e)
+                return None
+        else:
+            times_clicked = self.click_db.get(member_id, 0) + 1
+
+        self.click_db[member_id] = times_clicked
 
-        with open(pickle_name, "wb") as f:
-            p = pickle.Pickler(f)
+        if self.store is None:
+            self.mark_state_dirty()
 
-            p.dump(save)
+        return times_clicked
 
 
-def create_client() -> Amadeus:
+class ShardedAmadeus(Amadeus, discord.AutoShardedClient):
+    """
+    Amadeus, running some or all of its shards in this process.
+    """
+    pass
+
+
+def create_client(watchdog=False, shard_count: Optional[int] = None, shard_ids: Optional[List[int]] = None,
+                  store_path: Optional[str] = None, offload=False, linear_regex=False, lean=False,
+                  record: Optional[str] = None, admission: Union[bool, Dict[str, Any]] = False,
+                  metrics_port: Optional[int] = None) -> Amadeus:
     """
     Creates a client with the default settings
+    :param watchdog: Whether to watch the event loop for blocking calls.
+    :param shard_count: The total number of shards, if sharding.
+    :param shard_ids: The shards to run in this process, if not all of them. Needs shard_count.
+    :param store_path: The path of the store shared between processes, if running shards over several processes.
+    :param offload: Whether to match regexes against long messages in worker processes.
+    :param linear_regex: Whether to match regexes with RE2, in linear time, where RE2 supports them.
+    :param lean: Whether to only ask for the gateway intents the responses and commands need,
+    and turn off the message and member caches.
+    :param record: The path of a log to record the messages and commands seen to, for replaying later.
+    :param admission: Whether to limit how fast users and channels can set off responses and commands,
+    or the limits to use, as in AdmissionController.from_config.
+    :param metrics_port: The port to serve metrics on, for Prometheus, if any.
     :return: The client.
     """
-    intents = discord.Intents.default()
-    intents.message_content = True
+    if lean:
+        intents = discord.Intents.none()
+
+        for name in response.required_intents() | commands.REQUIRED_INTENTS:
+            setattr(intents, name, True)
+
+        # nothing reads the message or member caches, so don't fill them
+        options = {
+            "max_messages": None,
+            "member_cache_flags": discord.MemberCacheFlags.none(),
+            "chunk_guilds_at_startup": False,
+        }
+    else:
+        intents = discord.Intents.default()
+        intents.message_content = True
+
+        options = {}
+
+    store = SharedStore(store_path) if store_path is not None else None
+
+    metrics = Registry()
+    options["metrics"] = metrics
+    options["metrics_port"] = metrics_port
+
+    if admission is True:
+        options["admission"] = AdmissionController(metrics=metrics)
+    elif admission:
+        options["admission"] = AdmissionController.from_config(admission, metrics=metrics)
+
+    if linear_regex:
+        response.patterns.enable_linear_engine()
 
-    client = Amadeus(intents=intents)
+    if shard_count is None and shard_ids is None:
+        client = Amadeus(intents=intents, watchdog=watchdog, store=store, offload=offload, record=record, **options)
+    else:
+        client = ShardedAmadeus(intents=intents, watchdog=watchdog, store=store, offload=offload, record=record,
+                                shard_count=shard_count, shard_ids=shard_ids, **options)
 
     return client
@@ -1,10 +1,16 @@
+import asyncio
 import hashlib
+import random
 from collections import defaultdict
 from datetime import datetime, timezone
-from typing import List, Optional
-import subprocess
+from typing import List, Optional, Tuple
+import gzip
+import io
+import logging
+import math
 import re
 import tempfile
+import time
 
 import discord
 from discord import app_commands
@@ -12,7 +18,67 @@ from discord.ext import commands
 from tabulate import tabulate
 
 from . import embeds
+from . import memory
 from . import response
+from .stands import StandNames
+
+log = logging.getLogger(__name__)
+
+
+# the gateway intents the commands need, by their names in discord.Intents
+REQUIRED_INTENTS = {"guilds"}
+
+
+class AmadeusCommandTree(app_commands.CommandTree):
+    """
+    The command tree used by Amadeus.
+    """
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        # when the tree started handling this interaction, for working out dispatch time
+        interaction.extras["received"] = time.perf_counter()
+
+        lifecycle = getattr(interaction.client, "lifecycle", None)
+
+        if lifecycle is not None and not lifecycle.admit():
+            return False
+
+        watchdog = getattr(interaction.client, "watchdog", None)
+
+        if watchdog is not None and interaction.command is not None:
+            watchdog.track("/" + interaction.command.qualified_name)
+
+        # autocomplete goes through here for every keystroke, but it isn't the command being run
+        if interaction.type is discord.InteractionType.autocomplete:
+            return True
+
+        recorder = getattr(interaction.client, "recorder", None)
+
+        if recorder is not None:
+            recorder.record_command(interaction)
+
+        admission = getattr(interaction.client, "admission", None)
+
+        if admission is not None and not admission.admit_command(interaction):
+            await interaction.response.send_message(
+                embed=embeds.interned(embeds.error_embed, "Slow down! Try that again in a few seconds."),
+                ephemeral=True
+            )
+            return False
+
+        if interaction.command is not None:
+            commands_run = getattr(interaction.client, "commands_run", None)
+            if commands_run is not None:
+                commands_run.inc(command=interaction.command.qualified_name)
+
+            log.info("Command /%s run", interaction.command.qualified_name, extra={
+                "event": "command",
+                "guild": interaction.guild_id,
+                "channel": interaction.channel_id,
+                "command": interaction.command.qualified_name,
+            })
+
+        return True
 
 
 def add_commands(tree: app_commands.CommandTree):
@@ -28,6 +94,9 @@ def add_commands(tree: app_commands.CommandTree):
     tree.add_command(rate)
     tree.add_command(conversion_group)
     tree.add_command(dc)
+    tree.add_command(forgotten)
+    tree.add_command(stand_group)
+    tree.add_command(memory_usage)
 
 
 async def send_error(interaction: discord.Interaction, error: str):
@@ -56,9 +125,39 @@ async def send_success(interaction: discord.Interaction, message: str):
 
 @app_commands.command(name="ping", description="Plays a lovely game of ping pong and tells you the ping time.")
 async def ping(interaction: discord.Interaction):
-    dtime = datetime.now(tz=timezone.utc) - interaction.created_at
+    start = time.perf_counter()
+    samples = interaction.client.metrics.histogram("amadeus_ping_seconds", "The latencies measured by /ping", ["kind"])
+
+    # gateway to handler, by discord's clock against ours, so this includes any clock skew
+    delivery = (datetime.now(tz=timezone.utc) - interaction.created_at).total_seconds()
+    samples.observe(delivery, kind="delivery")
+
+    if "received" in interaction.extras:
+        samples.observe(start - interaction.extras["received"], kind="dispatch")
+
+    if math.isfinite(interaction.client.latency):
+        samples.observe(interaction.client.latency, kind="gateway")
+
+    await interaction.response.send_message("pong motherfucker")
+    samples.observe(time.perf_counter() - start, kind="rest")
+
+    def describe(name, histogram, **labels):
+        p = histogram.percentiles(50, 95, 99, **labels)
+        return (f"{name} {histogram.window(**labels)[-1] * 1000:.1f}ms "
+                f"(p50 {p[50] * 1000:.1f}, p95 {p[95] * 1000:.1f}, p99 {p[99] * 1000:.1f})")
+
+    lines = ["pong motherfucker"]
+
+    for name in ["gateway", "rest", "dispatch", "delivery"]:
+        if samples.window(kind=name):
+            lines.append(describe(name, samples, kind=name))
 
-    await interaction.response.send_message(f"pong motherfucker ({round(dtime.microseconds / 1000, 2)}ms)")
+    watchdog = interaction.client.watchdog
+
+    if watchdog is not None and watchdog.heartbeat.window():
+        lines.append(describe("heartbeat", watchdog.heartbeat))
+
+    await interaction.edit_original_response(content="\n".join(lines))
 
 
 async def autocomplete_response(interaction: discord.Interaction, current: str) -> List[app_commands.Choice[str]]:
@@ -109,6 +208,26 @@ class ResponseGroup(app_commands.Group):
 
         await interaction.response.send_message(embed=embed, ephemeral=True)
 
+    @app_commands.command(name="stats", description="Shows how many responses have fired, and what the rate limits dropped")
+    @is_me()
+    async def get_stats(self, interaction: discord.Interaction):
+        metrics = interaction.client.metrics.metrics
+        table = []
+
+        # the counters, most first, with what each row is put in front of its label
+        for name, prefix in [("amadeus_messages_total", "messages looked at"), ("amadeus_responses_fired_total", "fired"),
+                             ("amadeus_admitted_total", "admitted"), ("amadeus_shed_total", "shed by")]:
+            if name in metrics:
+                for labels, count in sorted(metrics[name].values().items(), key=lambda x: -x[1]):
+                    table.append([" ".join([prefix, *labels]), int(count)])
+
+        if interaction.client.admission is None:
+            table.append(["rate limiting", "off"])
+
+        embed = embeds.default_embed("Stats", f"```{tabulate(table, headers=['', 'Count'])}```")
+
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+
     @app_commands.command(name="set",
                           description="Sets a specified response's status, or all responses status to specified.")
     @app_commands.describe(response_name="The response to set, or \"all\" for all responses.")
@@ -129,13 +248,13 @@ class ResponseGroup(app_commands.Group):
                 await send_error(interaction, str(e))
                 return
 
-            interaction.client.save_state()
+            interaction.client.mark_state_dirty()
             await send_success(interaction, f"Succesfully set response {response_name} to state {state}")
 
         else:
             response.set_all_states(defaultdict(lambda: state))
 
-            interaction.client.save_state()
+            interaction.client.mark_state_dirty()
             await send_success(interaction, f"Set all responses to state {state}")
 
     @app_commands.command(name="enable",
@@ -151,13 +270,13 @@ class ResponseGroup(app_commands.Group):
                 return
 
             r.enabled = True
-            interaction.client.save_state()
+            interaction.client.mark_state_dirty()
             await send_success(interaction, f"Enabled response {response_name}")
 
         else:
 
             response.set_all_enabled(defaultdict(lambda: True))
-            interaction.client.save_state()
+            interaction.client.mark_state_dirty()
             await send_success(interaction, f"Enabled all responses")
 
     @app_commands.command(name="disable",
@@ -173,20 +292,29 @@ class ResponseGroup(app_commands.Group):
                 return
 
             r.enabled = False
-            interaction.client.save_state()
+            interaction.client.mark_state_dirty()
             await send_success(interaction, f"Disabled response {response_name}")
 
         else:
 
             response.set_all_enabled(defaultdict(lambda: False))
-            interaction.client.save_state()
+            interaction.client.mark_state_dirty()
             await send_success(interaction, f"Disabled all responses")
 
 response_group = ResponseGroup()
 
+
 @response_group.error
 async def on_response_group_error(interaction: discord.Interaction, error):
-    await send_error(interaction, "Hey, only the owner of this bot can use this command!")
+    embed = embeds.interned(embeds.error_embed, "Hey, only the owner of this bot can use this command!")
+    await interaction.response.send_message(embed=embed, ephemeral=True)
+
+
+@app_commands.command(name="memory", description="Shows how much memory the bot is using")
+@is_me()
+async def memory_usage(interaction: discord.Interaction):
+    embed = embeds.default_embed("Memory", f"```{memory.memory_report(interaction.client)}```")
+    await interaction.response.send_message(embed=embed, ephemeral=True)
 
 
 
@@ -214,16 +342,14 @@ async def click(interaction: discord.Interaction, member: discord.Member):
     clicker = embeds.boldifier(interaction.user.name)
     clickee = embeds.boldifier(member.name)
 
-    try:
-        times_clicked = interaction.client.click_db[member.id]
-    except KeyError:
-        times_clicked = 0
+    times_clicked = interaction.client.click(member.id)
 
-    times_clicked += 1
-
-    interaction.client.click_db[member.id] = times_clicked
-
-    interaction.client.save_state()
+    if times_clicked is None:
+        await interaction.response.send_message(
+            embed=embeds.interned(embeds.error_embed, "Too many clicks at once! Try that again in a moment."),
+            ephemeral=True
+        )
+        return
 
     embed = embeds.action_embed(f"{clicker} clicks {clickee}. {clickee} has been clicked {times_clicked} time{'s' if times_clicked != 1 else ''}.")
 
@@ -270,9 +396,52 @@ async def rate(interaction: discord.Interaction, something: str):
         embed=embeds.default_embed("", f"{intro} {comment} {rating_method}")
     )
 
+# how much of dc's output fits in the embed, inside the code block
+DC_PREVIEW_LIMIT = embeds.DESCRIPTION_LIMIT - len("``````")
+# the most output kept for an attachment, after which dc is stopped
+DC_ATTACHMENT_LIMIT = 4 * 2 ** 20
+
+
+async def read_capped(stream: asyncio.StreamReader, preview_limit: int, limit: int,
+                      compress=False) -> Tuple[bytes, int, Optional[bytes]]:
+    """
+    Reads a stream as the output comes in, stopping once enough has been read.
+    :param stream: The stream.
+    :param preview_limit: How many bytes to keep from the start of the output.
+    :param limit: The most bytes to read.
+    :param compress: Whether to also keep all the output that's read, gzipped.
+    :return: The first preview_limit bytes, how many bytes were read, and the gzipped output if compress.
+    """
+    preview = bytearray()
+    total = 0
+    compressed = io.BytesIO() if compress else None
+    gz = gzip.GzipFile(fileobj=compressed, mode="wb", compresslevel=6) if compress else None
+
+    while total < limit:
+        chunk = await stream.read(min(2 ** 16, limit - total))
+
+        if not chunk:
+            break
+
+        total += len(chunk)
+
+        if len(preview) < preview_limit:
+            preview += chunk[:preview_limit - len(preview)]
+
+        if gz is not None:
+            gz.write(chunk)
+
+    if gz is not None:
+        gz.close()
+        return bytes(preview), total, compressed.getvalue()
+
+    return bytes(preview), total, None
+
+
 @app_commands.command(name="dc", description="Runs a program in dc")
-@app_commands.describe(program="The program to be run", stdin="(Optional) stdin for the program")
-async def dc(interaction: discord.Interaction, program: str, stdin: Optional[str]):
+@app_commands.describe(program="The program to be run", stdin="(Optional) stdin for the program",
+                       attach="(Optional) attach all the output, gzipped, if it's too long for the message")
+async def dc(interaction: discord.Interaction, program: str, stdin: Optional[str], attach: bool = False):
 
     DC_ENCODING = "ascii"
     DC_REGEX = r"![^><=]"
@@ -294,24 +463,175 @@ async def dc(interaction: discord.Interaction, program: str, stdin: Optional[str
         fp.write(program.encode(DC_ENCODING))
         fp.seek(0)
 
+        p = await asyncio.create_subprocess_exec(
+            "dc", "-f", fp.name,
+            stdin=asyncio.subprocess.PIPE if stdin else asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.STDOUT
+        )
+
+        # so it gets killed if the bot shuts down while it's running
+        lifecycle = getattr(interaction.client, "lifecycle", None)
+        if lifecycle is not None:
+            lifecycle.track_process(p)
+
+        dc_runs = getattr(interaction.client, "dc_runs", None)
+
         try:
 
             if stdin:
-                p = subprocess.run(["dc", "-f", fp.name], input=stdin.encode(DC_ENCODING), stdout=subprocess.PIPE, stderr=subprocess.STDOUT, timeout=5)
-            else: 
-                p = subprocess.run(["dc", "-f", fp.name], stdout=subprocess.PIPE, stderr=subprocess.STDOUT, timeout=2)
+                p.stdin.write(stdin.encode(DC_ENCODING))
+                await p.stdin.drain()
+                p.stdin.close()
+
+            # read one byte past what fits, to tell whether anything was cut off
+            limit = DC_ATTACHMENT_LIMIT if attach else DC_PREVIEW_LIMIT + 1
+
+            preview, total, compressed = await asyncio.wait_for(
+                read_capped(p.stdout, DC_PREVIEW_LIMIT, limit, compress=attach), timeout=5 if stdin else 2
+            )
+
+            # there's no use in letting it carry on once nothing more will be read
+            if total >= limit:
+                try:
+                    p.kill()
+                except ProcessLookupError:
+                    pass
+
+            # read what's left in the pipe, or the process is never reaped
+            await p.communicate()
+
+            note = None
+            kwargs = {}
+
+            if total > len(preview):
+                note = f"showing the first {len(preview)} bytes"
 
+                if compressed is not None:
+                    note += f" of {total}" + (" (dc was stopped there)" if total >= limit else "")
+                    note += ", all of it is attached"
+                    kwargs["file"] = discord.File(io.BytesIO(compressed), filename="dc_output.txt.gz")
+                else:
+                    note += ", use attach for the rest"
+
+            if dc_runs is not None:
+                dc_runs.inc(outcome="ok" if note is None else "truncated")
 
             await interaction.response.send_message(
-                embed=embeds.dc_embed(str(p.stdout, encoding=DC_ENCODING), program, stdin)
+                embed=embeds.dc_embed(str(preview, encoding=DC_ENCODING, errors="replace"), program, stdin,
+                                      note=note),
+                **kwargs
             )
 
-        except subprocess.TimeoutExpired:
+        except asyncio.TimeoutError:
+            try:
+                p.kill()
+            except ProcessLookupError:
+                pass
+            await p.communicate()
+
+            if dc_runs is not None:
+                dc_runs.inc(outcome="timeout")
+
             await interaction.response.send_message(
                 embed=embeds.dc_embed("dc timeout reached (2s)", program, None, embeds.ERROR_COLOR)
             )
 
+        finally:
+            if lifecycle is not None:
+                lifecycle.forget_process(p)
+
+
+
+
+async def autocomplete_forgotten(interaction: discord.Interaction, current: str) -> List[app_commands.Choice[str]]:
+    store = interaction.client.forgotten_images
+    store.rescan_if_changed()
+    return [
+        app_commands.Choice(name=name, value=name)
+        for name in store.names() if current.lower() in name.lower()
+    ][:25]
+
+
+@app_commands.command(name="forgotten", description="Posts a forgotten image")
+@app_commands.describe(name="(Optional) The image to post. A random one is picked if not given.")
+@app_commands.autocomplete(name=autocomplete_forgotten)
+async def forgotten(interaction: discord.Interaction, name: Optional[str]):
+    store = interaction.client.forgotten_images
+    store.rescan_if_changed()
+
+    if name is None:
+        names = store.names()
+
+        if not names:
+            await send_error(interaction, "There are no forgotten images. They've been forgotten.")
+            return
+
+        name = random.choice(names)
+
+    asset = store.get(name)
+
+    if asset is None:
+        await send_error(interaction, f"Cannot find image {name}")
+        return
+
+    url = store.cached_url(asset)
+
+    # it's been uploaded before, so just link to that instead of uploading it again
+    if url is not None:
+        await interaction.response.send_message(url)
+        return
+
+    await interaction.response.send_message(file=store.file(asset))
+
+    message = await interaction.original_response()
+
+    if message.attachments:
+        store.remember_url(asset, message.attachments[0].url)
+
+
+stand_names = StandNames("data/stand_names.txt")
+
+
+async def autocomplete_stand(interaction: discord.Interaction, current: str) -> List[app_commands.Choice[str]]:
+    return [
+        app_commands.Choice(name=name, value=name)
+        for name in stand_names.search(current)
+    ]
+
+
+class StandGroup(app_commands.Group):
+    def __init__(self):
+        super().__init__(name='stand', description="Stands, from the stand name list")
+
+    @app_commands.command(name="get", description="Tells you what someone's stand is")
+    @app_commands.describe(member="(Optional) Whose stand to get. Yours if not given.")
+    async def get_stand(self, interaction: discord.Interaction, member: Optional[discord.Member]):
+        member = member or interaction.user
+        stand = stand_names.assign(member.id)
+
+        if stand is None:
+            await send_error(interaction, "There are no stands to give out.")
+            return
+
+        await interaction.response.send_message(
+            embed=embeds.action_embed(f"{embeds.boldifier(member.name)}'s stand is {embeds.boldifier(stand)}.")
+        )
+
+    @app_commands.command(name="search", description="Searches the stand name list")
+    @app_commands.describe(query="The stand name to search for")
+    @app_commands.autocomplete(query=autocomplete_stand)
+    async def search_stand(self, interaction: discord.Interaction, query: str):
+        found = stand_names.search(query)
+
+        if not found:
+            await send_error(interaction, f"No stands found for {query}")
+            return
+
+        await interaction.response.send_message(
+            embed=embeds.default_embed("Stands", "\n".join(found)), ephemeral=True
+        )
 
+stand_group = StandGroup()
 
 
 class ConversionGroup(app_commands.Group):
@@ -1,3 +1,6 @@
+from functools import lru_cache
+from typing import Callable, Iterable, Iterator
+
 import discord
 
 
@@ -5,6 +8,23 @@ DEFAULT_COLOR = 0x521414
 ERROR_COLOR = 0xab0306
 SUCCESS_COLOR = 0x079100
 
+# the most discord allows in an embed's description
+DESCRIPTION_LIMIT = 4096
+
+
+@lru_cache(maxsize=64)
+def interned(embed_generator: Callable[..., discord.Embed], *args) -> discord.Embed:
+    """
+    Returns an embed that is only built once for a given generator and arguments.
+    This is for embeds that are always the same, like a fixed error message.
+    The embed is shared, so don't modify it.
+    :param embed_generator: The function that generates the embed, e.g. error_embed.
+    :param args: The arguments to the generator.
+    :return: The shared embed.
+    """
+    return embed_generator(*args)
+
+
 def default_embed(title: str, msg: str, color=DEFAULT_COLOR):
     """
     Creates a mostly empty embed.
@@ -51,7 +71,39 @@ def action_embed(text):
         "", text
     )
 
-def dc_embed(output: str, command: str, stdin: str | None, color=DEFAULT_COLOR):
+
+def chunk_lines(lines: Iterable[str], limit=DESCRIPTION_LIMIT, separator="\n") -> Iterator[str]:
+    """
+    Joins lines together into chunks that each fit in an embed, without splitting a line across chunks.
+    Lines are consumed as they're needed, so this can be fed a generator.
+    :param lines: The lines.
+    :param limit: The most characters a chunk can have.
+    :param separator: What goes between lines in a chunk.
+    :return: An iterator of the chunks.
+    """
+    chunk = []
+    length = 0
+
+    for line in lines:
+        if len(line) > limit:
+            # a line that can't fit anywhere is cut short
+            line = line[:limit - 1] + "…"
+
+        added = len(line) + (len(separator) if chunk else 0)
+
+        if chunk and length + added > limit:
+            yield separator.join(chunk)
+            chunk = []
+            length = 0
+            added = len(line)
+
+        chunk.append(line)
+        length += added
+
+    if chunk:
+        yield separator.join(chunk)
+
+def dc_embed(output: str, command: str, stdin: str | None, color=DEFAULT_COLOR, note: str | None = None):
 
     embed = discord.Embed()
 
@@ -64,4 +116,8 @@ def dc_embed(output: str, command: str, stdin: str | None, color=DEFAULT_COLOR):
     if stdin:
         embed.add_field(name="stdin", value="`"+stdin+"`", inline=True)
 
+    # e.g. that the output was cut off
+    if note:
+        embed.add_field(name="output truncated", value=note, inline=False)
+
     return embed
@@ -0,0 +1,55 @@
+from typing import Dict, Iterable, Union
+
+import discord
+
+
+class EmojiResolver:
+    """
+    Turns emoji ids and unicode emoji into something that can be reacted with, without looking in the guild cache.
+    The table of custom emojis is built once when the client is ready and kept up to date as guilds change
+    their emojis. An id that isn't in it is still reacted with, by id alone, as discord only needs the id.
+    """
+
+    def __init__(self):
+        """
+        Creates a new EmojiResolver, with an empty table.
+        """
+        self.table: Dict[int, discord.PartialEmoji] = {}
+
+    def rebuild(self, emojis: Iterable[discord.Emoji]):
+        """
+        Rebuilds the table from scratch.
+        :param emojis: Every emoji the client can see, e.g. client.emojis.
+        :return: Nothing
+        """
+        self.table = {x.id: discord.PartialEmoji(name=x.name, id=x.id, animated=x.animated) for x in emojis}
+
+    def update(self, before: Iterable[discord.Emoji], after: Iterable[discord.Emoji]):
+        """
+        Updates the table after a guild changes its emojis.
+        :param before: The guild's emojis before the change.
+        :param after: The guild's emojis after the change.
+        :return: Nothing
+        """
+        for x in before:
+            self.table.pop(x.id, None)
+
+        for x in after:
+            self.table[x.id] = discord.PartialEmoji(name=x.name, id=x.id, animated=x.animated)
+
+    def resolve(self, emoji: Union[int, str]) -> Union[discord.PartialEmoji, str]:
+        """
+        Gets something to react with for an emoji.
+        :param emoji: The id of a custom emoji, or a unicode emoji.
+        :return: The emoji, ready for add_reaction.
+        """
+        if isinstance(emoji, str):
+            return emoji
+
+        partial = self.table.get(emoji)
+
+        if partial is None:
+            # discord ignores the name of a custom emoji when reacting, as long as there is one
+            partial = self.table[emoji] = discord.PartialEmoji(name="_", id=emoji)
+
+        return partial
@@ -0,0 +1,136 @@
+import asyncio
+import logging
+import signal
+from typing import Optional, Set
+
+import discord
+
+log = logging.getLogger(__name__)
+
+
+class Lifecycle:
+    """
+    Handles shutting a client down cleanly.
+    On SIGINT or SIGTERM it stops taking new messages and commands, waits for the ones being handled to finish
+    (killing any subprocesses still running once the deadline passes), and then closes the client,
+    which saves the state one last time.
+    """
+
+    def __init__(self, client: discord.Client, drain_timeout=10.0, kill_timeout=2.0):
+        """
+        Creates a new Lifecycle
+        :param client: The client to shut down.
+        :param drain_timeout: How long, in seconds, to wait for in-flight work before killing subprocesses.
+        :param kill_timeout: How long, in seconds, to wait after that before cancelling what's left.
+        """
+        self.client = client
+        self.drain_timeout = drain_timeout
+        self.kill_timeout = kill_timeout
+
+        self.accepting = True
+        self.in_flight: Set[asyncio.Task] = set()
+        self.processes: Set[asyncio.subprocess.Process] = set()
+
+        self._shutdown: Optional[asyncio.Task] = None
+
+    def install_signal_handlers(self):
+        """
+        Shuts down on SIGINT and SIGTERM, instead of dying where it stands.
+        Must be called from inside the event loop. Does nothing where the loop doesn't support signal handlers.
+        :return: Nothing
+        """
+        loop = asyncio.get_running_loop()
+
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, self.request_shutdown, sig)
+            except (NotImplementedError, RuntimeError):
+                # windows, or not the main thread
+                return
+
+    def request_shutdown(self, sig: Optional[int] = None):
+        """
+        Starts shutting down, if it hasn't started already.
+        :param sig: The signal that asked for it, if any.
+        :return: Nothing
+        """
+        if self._shutdown is not None:
+            return
+
+        if sig is not None:
+            log.info("Received %s, shutting down", signal.Signals(sig).name)
+
+        self._shutdown = asyncio.get_running_loop().create_task(self.shutdown())
+
+    def admit(self) -> bool:
+        """
+        Checks whether new work is being taken, and if so, counts the current task as in flight until it finishes.
+        :return: Whether to go ahead with the work.
+        """
+        if not self.accepting:
+            return False
+
+        task = asyncio.current_task()
+
+        if task is not None and task is not self._shutdown:
+            self.in_flight.add(task)
+            task.add_done_callback(self.in_flight.discard)
+
+        return True
+
+    def track_process(self, process: asyncio.subprocess.Process):
+        """
+        Keeps track of a subprocess, so it can be killed if it's still running when the drain deadline passes.
+        :param process: The subprocess.
+        :return: Nothing
+        """
+        self.processes.add(process)
+
+    def forget_process(self, process: asyncio.subprocess.Process):
+        """
+        Stops keeping track of a subprocess, once it's finished.
+        :param process: The subprocess.
+        :return: Nothing
+        """
+        self.processes.discard(process)
+
+    async def drain(self):
+        """
+        Waits for the work in flight to finish.
+        Subprocesses still running after drain_timeout are killed, and anything still going kill_timeout after that
+        is cancelled.
+        :return: Nothing
+        """
+        if self.in_flight:
+            log.info("Waiting for %d in-flight tasks", len(self.in_flight))
+            await asyncio.wait(set(self.in_flight), timeout=self.drain_timeout)
+
+        if self.processes:
+            log.warning("Killing %d subprocesses", len(self.processes))
+
+            for process in list(self.processes):
+                try:
+                    process.kill()
+                except ProcessLookupError:
+                    pass
+
+        if self.in_flight:
+            await asyncio.wait(set(self.in_flight), timeout=self.kill_timeout)
+
+        if self.in_flight:
+            log.warning("Cancelling %d tasks that didn't finish in time", len(self.in_flight))
+
+            for task in list(self.in_flight):
+                task.cancel()
+
+            await asyncio.wait(set(self.in_flight), timeout=self.kill_timeout)
+
+    async def shutdown(self):
+        """
+        Stops taking new work, drains what's in flight, and closes the client.
+        :return: Nothing
+        """
+        self.accepting = False
+
+        await self.drain()
+        await self.client.close()
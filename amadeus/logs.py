@@ -0,0 +1,157 @@
+"""
+Logging for Amadeus.
+
+Records are handed to a queue as they're logged and written out by a background thread, so logging never
+waits on stdout from the event loop. Each record is written as one line of JSON, with the guild, channel,
+response and latency attached where they're known, e.g.
+
+    log.info("Response fired", extra={"event": "response", "guild": 1, "channel": 2, "response": "hug",
+                                      "latency": 0.004})
+
+High-volume events can be sampled: a record with an "event" in the sample rates is only kept at that rate,
+and says so in its "sampled" field.
+"""
+import copy
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+# extra fields that are copied into the json when a record has them
+FIELDS = ("event", "guild", "channel", "response", "command", "latency")
+
+# the sample rates used when none are given, by event
+DEFAULT_SAMPLE_RATES = {"response": 0.1}
+
+_plain = logging.Formatter()
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Formats a record as a single line of JSON.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+
+        for field in FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+
+        sampled = getattr(record, "sampled", None)
+        if sampled is not None:
+            entry["sampled"] = sampled
+
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+
+        return json.dumps(entry, default=str)
+
+
+class SampleFilter(logging.Filter):
+    """
+    Keeps only some of the records for high-volume events, by their "event" field.
+    """
+
+    def __init__(self, rates: Dict[str, float]):
+        """
+        Creates a new SampleFilter
+        :param rates: The fraction of records to keep, by event. Events not in here are all kept.
+        """
+        super().__init__()
+        self.rates = rates
+        self._random = random.Random()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        rate = self.rates.get(getattr(record, "event", None))
+
+        if rate is None:
+            return True
+
+        record.sampled = rate
+        return self._random.random() < rate
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """
+    A QueueHandler that drops records when the queue is full, rather than waiting for room.
+    """
+
+    def __init__(self, q: queue.Queue):
+        super().__init__(q)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # like QueueHandler.prepare, but keeps the traceback apart from the message, for the json
+        record = copy.copy(record)
+        record.message = record.getMessage()
+
+        if record.exc_info and not record.exc_text:
+            record.exc_text = _plain.formatException(record.exc_info)
+
+        record.msg = record.message
+        record.args = None
+        record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def dropped_records() -> Optional[int]:
+    """
+    Counts the records dropped so far because the queue was full.
+    :return: The count, or None if setup_logging hasn't been called.
+    """
+    handlers = [h for h in logging.getLogger().handlers if isinstance(h, DroppingQueueHandler)]
+
+    if not handlers:
+        return None
+
+    return sum(h.dropped for h in handlers)
+
+
+def setup_logging(level="INFO", json_lines=True, sample: Optional[Dict[str, float]] = None,
+                  max_queued=10000) -> logging.handlers.QueueListener:
+    """
+    Sends every log record, including discord.py's, through a queue to a background thread that writes them
+    to stderr.
+    :param level: The lowest level to log.
+    :param json_lines: Whether to write records as JSON, or as plain text.
+    :param sample: The fraction of records to keep for high-volume events, by event. Defaults to DEFAULT_SAMPLE_RATES.
+    :param max_queued: The most records that can be waiting to be written. Any more are dropped.
+    :return: The listener writing the records. Stop it before exiting, so everything queued gets written.
+    """
+    q = queue.Queue(max_queued)
+
+    handler = DroppingQueueHandler(q)
+    handler.addFilter(SampleFilter(DEFAULT_SAMPLE_RATES if sample is None else sample))
+
+    output = logging.StreamHandler(sys.stderr)
+    if json_lines:
+        output.setFormatter(JsonFormatter())
+    else:
+        output.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+
+    root = logging.getLogger()
+    root.setLevel(level)
+    root.addHandler(handler)
+
+    listener = logging.handlers.QueueListener(q, output)
+    listener.start()
+    return listener
@@ -0,0 +1,59 @@
+import os
+import sys
+from typing import Optional
+
+import discord
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+def resident_memory() -> Optional[int]:
+    """
+    Gives the resident memory of this process.
+    This is read from /proc where there is one, and is otherwise the peak resident memory so far.
+    :return: The resident memory, in bytes, or None if it can't be found out.
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        pass
+
+    if resource is None:
+        return None
+
+    try:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    except (OSError, ValueError):
+        return None
+
+    # macos reports this in bytes, everything else in kilobytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def memory_report(client: discord.Client) -> str:
+    """
+    Describes how much memory the client is using, and how much of it is the discord caches.
+    :param client: The client.
+    :return: The description, one line per number.
+    """
+    rss = resident_memory()
+    guilds = len(client.guilds)
+
+    lines = []
+
+    if rss is None:
+        lines.append("resident memory: unknown")
+    else:
+        lines.append(f"resident memory: {rss / 2 ** 20:.1f} MiB")
+
+        if guilds:
+            lines.append(f"per guild: {rss / guilds / 2 ** 10:.1f} KiB over {guilds} guilds")
+
+    lines.append(f"cached messages: {len(client.cached_messages)}")
+    lines.append(f"cached members: {sum(len(g.members) for g in client.guilds)}")
+
+    return "\n".join(lines)
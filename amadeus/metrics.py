@@ -0,0 +1,350 @@
+"""
+Counters, gauges and histograms for watching how the bot is doing, exposed over HTTP in the Prometheus text format.
+
+Metrics are only ever updated from the event loop, so none of this needs locks. Each metric can have labels,
+given as keyword arguments when it's updated, e.g.
+
+    registry.counter("amadeus_responses_fired_total", "Responses fired", ["response"]).inc(response="hug")
+"""
+import asyncio
+import bisect
+import logging
+import math
+from collections import deque
+from typing import Callable, Deque, Dict, Iterator, List, Optional, Sequence, Tuple
+
+log = logging.getLogger(__name__)
+
+# in seconds, for latencies from a millisecond up to ten seconds
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_labels(names: Sequence[str], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [
+        '{}="{}"'.format(name, value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for name, value in zip(names, values)
+    ]
+
+    if extra:
+        pairs.append(extra)
+
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if isinstance(value, int) or value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+class Metric:
+    """
+    Something being measured, with a value for every combination of its labels that has been seen.
+    """
+
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (),
+                 function: Optional[Callable[[], Optional[float]]] = None):
+        """
+        Creates a new Metric
+        :param name: The name of the metric, e.g. amadeus_messages_total.
+        :param help: A description of the metric.
+        :param labels: The names of the labels the metric has.
+        :param function: A function that gives the value whenever it's exposed, for a metric without labels
+        whose value is kept somewhere else. It can return None to leave the metric out.
+        """
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.function = function
+        self._values = {}
+
+    def _key(self, labels: Dict[str, object]) -> Tuple[str, ...]:
+        if len(labels) != len(self.labels):
+            raise ValueError(f"{self.name} needs the labels {self.labels}, not {tuple(labels)}")
+
+        return tuple(str(labels[x]) for x in self.labels)
+
+    def samples(self) -> Iterator[Tuple[str, Tuple[str, ...], str, float]]:
+        """
+        Gives every value of the metric, for exposing.
+        :return: An iterator of (suffix, label values, any extra label, value)
+        """
+        if self.function is None:
+            yield from (("", key, "", value) for key, value in self._values.items())
+            return
+
+        try:
+            value = self.function()
+        except Exception:
+            # one broken metric shouldn't stop the rest being exposed
+            log.exception("Working out %s failed", self.name)
+            return
+
+        if value is not None:
+            yield "", (), "", value
+
+    def expose(self) -> List[str]:
+        """
+        Writes the metric out in the Prometheus text format.
+        :return: The lines.
+        """
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+        for suffix, key, extra, value in self.samples():
+            lines.append(f"{self.name}{suffix}{_format_labels(self.labels, key, extra)} {_format_value(value)}")
+
+        return lines
+
+
+class Counter(Metric):
+    """
+    A count that only goes up, e.g. the number of messages handled.
+    """
+
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        """
+        Adds to the count.
+        :param amount: How much to add.
+        :param labels: The labels to add to the count for.
+        :return: Nothing
+        """
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        """
+        Gets the count.
+        :param labels: The labels to get the count for.
+        :return: The count.
+        """
+        if self.function is not None:
+            return self.function() or 0
+        return self._values.get(self._key(labels), 0)
+
+    def values(self) -> Dict[Tuple[str, ...], float]:
+        """
+        Gets every count.
+        :return: A dictionary of the form {label values: count}.
+        """
+        return dict(self._values)
+
+
+class Gauge(Metric):
+    """
+    A value that can go up and down, e.g. the number of tasks in flight.
+    A gauge can also be worked out by a function whenever it's exposed, instead of being set.
+    """
+
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def value(self, **labels) -> float:
+        if self.function is not None:
+            return self.function()
+        return self._values.get(self._key(labels), 0)
+
+
+class Histogram(Metric):
+    """
+    The distribution of a measurement, e.g. how long responses take, in buckets.
+    The most recent samples are also kept, for working out exact percentiles over them (e.g. for /ping).
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS,
+                 window=200):
+        """
+        Creates a new Histogram
+        :param name: The name of the metric.
+        :param help: A description of the metric.
+        :param labels: The names of the labels the metric has.
+        :param buckets: The upper bounds of the buckets, in increasing order. +Inf is added on the end.
+        :param window: How many of the most recent samples to keep for percentiles.
+        """
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+        self.window_size = window
+        # label values -> [bucket counts, sum, count, recent samples]
+        self._values: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, **labels):
+        """
+        Records a sample.
+        :param value: The sample.
+        :param labels: The labels to record it under.
+        :return: Nothing
+        """
+        key = self._key(labels)
+        entry = self._values.get(key)
+
+        if entry is None:
+            entry = self._values[key] = [[0] * len(self.buckets), 0.0, 0, deque(maxlen=self.window_size)]
+
+        # the first bucket whose bound is at least the value, if any; the rest only go in +Inf
+        i = bisect.bisect_left(self.buckets, value)
+        if i < len(self.buckets):
+            entry[0][i] += 1
+
+        entry[1] += value
+        entry[2] += 1
+        entry[3].append(value)
+
+    def window(self, **labels) -> Deque[float]:
+        """
+        Gets the most recent samples, oldest first.
+        :param labels: The labels to get the samples for.
+        :return: The samples. Empty if there are none yet.
+        """
+        entry = self._values.get(self._key(labels))
+        return entry[3] if entry is not None else deque()
+
+    def percentiles(self, *ps: float, **labels) -> Dict[float, Optional[float]]:
+        """
+        Works out percentiles over the most recent samples, using the nearest rank.
+        :param ps: The percentiles to work out, from 0 to 100.
+        :param labels: The labels to work them out for.
+        :return: A dictionary of the form {percentile: value}, with None values if there are no samples yet.
+        """
+        ordered = sorted(self.window(**labels))
+
+        if not ordered:
+            return {p: None for p in ps}
+
+        return {p: ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)] for p in ps}
+
+    def samples(self):
+        for key, (counts, total, count, _) in self._values.items():
+            cumulative = 0
+
+            for bound, n in zip(self.buckets, counts):
+                cumulative += n
+                yield "_bucket", key, f'le="{_format_value(bound)}"', cumulative
+
+            yield "_bucket", key, 'le="+Inf"', count
+            yield "_sum", key, "", total
+            yield "_count", key, "", count
+
+
+class Registry:
+    """
+    All the metrics, by name.
+    Asking for a metric that already exists gives back the existing one, so anything can ask for one by name.
+    """
+
+    def __init__(self):
+        self.metrics: Dict[str, Metric] = {}
+
+    def _get(self, cls, name: str, help: str, labels: Sequence[str], **options) -> Metric:
+        metric = self.metrics.get(name)
+
+        if metric is None:
+            metric = self.metrics[name] = cls(name, help, labels, **options)
+        elif not isinstance(metric, cls):
+            raise ValueError(f"{name} is already a {metric.kind}")
+
+        return metric
+
+    def counter(self, name: str, help: str = "", labels: Sequence[str] = (),
+                function: Optional[Callable[[], Optional[float]]] = None) -> Counter:
+        return self._get(Counter, name, help, labels, function=function)
+
+    def gauge(self, name: str, help: str = "", labels: Sequence[str] = (),
+              function: Optional[Callable[[], Optional[float]]] = None) -> Gauge:
+        return self._get(Gauge, name, help, labels, function=function)
+
+    def histogram(self, name: str, help: str = "", labels: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._get(Histogram, name, help, labels, buckets=buckets)
+
+    def expose(self) -> str:
+        """
+        Writes out every metric in the Prometheus text format.
+        :return: The text.
+        """
+        lines = []
+
+        for metric in self.metrics.values():
+            lines.extend(metric.expose())
+
+        return "\n".join(lines) + "\n"
+
+
+class MetricsServer:
+    """
+    A tiny HTTP server on the event loop that serves a registry at /metrics, for Prometheus to scrape.
+    """
+
+    def __init__(self, registry: Registry, port: int, host="127.0.0.1"):
+        """
+        Creates a new MetricsServer
+        :param registry: The registry to serve.
+        :param port: The port to listen on.
+        :param host: The address to listen on. Defaults to only this machine.
+        """
+        self.registry = registry
+        self.port = port
+        self.host = host
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    async def start(self):
+        """
+        Starts listening.
+        :return: Nothing
+        """
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        log.info("Serving metrics on http://%s:%d/metrics", self.host, self.port)
+
+    async def close(self):
+        """
+        Stops listening.
+        :return: Nothing
+        """
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request = await asyncio.wait_for(reader.readline(), timeout=5)
+
+            # skip the headers, nothing in them matters here
+            while (await asyncio.wait_for(reader.readline(), timeout=5)).strip():
+                pass
+
+            parts = request.decode("latin-1").split()
+
+            if len(parts) >= 2 and parts[0] == "GET" and parts[1].split("?")[0] == "/metrics":
+                status = "200 OK"
+                body = self.registry.expose().encode("utf8")
+                content_type = "text/plain; version=0.0.4; charset=utf-8"
+            else:
+                status = "404 Not Found"
+                body = b"not found\n"
+                content_type = "text/plain; charset=utf-8"
+
+            writer.write(
+                f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\nContent-Length: {len(body)}\r\n"
+                f"Connection: close\r\n\r\n".encode("latin-1") + body
+            )
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
@@ -0,0 +1,538 @@
+"""
+Recording and replaying of inbound traffic, for performance testing without a connection to discord.
+
+The recorder writes every message and command the bot sees to a compact binary log:
+
+    header: b"AMRL" | version (uint16)
+    record: kind (uint8) | seconds since the recording started (float64) | body
+
+User and channel ids are replaced by keyed hashes, with a key that isn't saved, so a log can't be traced
+back to anyone. The bot's own id is kept, as the responses look for it.
+
+The replay driver feeds a log through the real Amadeus handlers, with the discord side stubbed out,
+and reports throughput, latency percentiles and which responses fired. Run it as
+
+    python -m amadeus.replay traffic.log --speed max --out new.json
+    python -m amadeus.replay --diff old.json new.json
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import random
+import re
+import struct
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional, Tuple
+
+import discord
+
+from . import commands, response
+
+MAGIC = b"AMRL"
+VERSION = 1
+
+HELLO = 0
+MESSAGE = 1
+COMMAND = 2
+
+_HEADER = struct.Struct(">4sH")
+_RECORD = struct.Struct(">Bd")
+_HELLO = struct.Struct(">Q")
+_MESSAGE = struct.Struct(">QQQH")
+_COMMAND = struct.Struct(">QQ")
+_SHORT = struct.Struct(">H")
+_LONG = struct.Struct(">I")
+
+# user (<@id> or <@!id>), role (<@&id>) and channel (<#id>) mentions
+_MENTION = re.compile(r"<(@!?|@&|#)(\d+)>")
+
+
+class Recorder:
+    """
+    Records the messages and commands a client sees to a log file, anonymizing them as it goes.
+    """
+
+    def __init__(self, path: str, client: discord.Client):
+        """
+        Creates a new Recorder, appending to the log if it already exists.
+        :param path: The path of the log.
+        :param client: The client being recorded. Its own id is kept as it is.
+        """
+        self.client = client
+        self.start = time.monotonic()
+
+        # a fresh key for every recording, so ids from different recordings can't be linked either
+        self._key = os.urandom(16)
+        self._said_hello = False
+
+        new = not os.path.exists(path) or os.path.getsize(path) == 0
+        self._file = open(path, "ab")
+
+        if new:
+            self._file.write(_HEADER.pack(MAGIC, VERSION))
+
+    def close(self):
+        """
+        Closes the log.
+        :return: Nothing
+        """
+        self._file.close()
+
+    def anonymize(self, id: Optional[int]) -> int:
+        """
+        Replaces an id with a keyed hash of it, keeping the bot's own id.
+        :param id: The id, or None.
+        :return: The anonymized id, or 0 for None.
+        """
+        if id is None:
+            return 0
+
+        if self.client.user is not None and id == self.client.user.id:
+            return id
+
+        digest = hashlib.blake2b(str(id).encode("ascii"), key=self._key, digest_size=8).digest()
+        return int.from_bytes(digest, "big")
+
+    def _write(self, kind: int, body: bytes):
+        if not self._said_hello and self.client.user is not None:
+            self._said_hello = True
+            self._write(HELLO, _HELLO.pack(self.client.user.id))
+
+        self._file.write(_RECORD.pack(kind, time.monotonic() - self.start))
+        self._file.write(body)
+
+    def record_message(self, message: discord.Message):
+        """
+        Records a message.
+        :param message: The message.
+        :return: Nothing
+        """
+        content = _MENTION.sub(
+            lambda m: f"<{m.group(1)}{self.anonymize(int(m.group(2)))}>", message.content
+        ).encode("utf8")
+        mentions = [self.anonymize(x) for x in message.raw_mentions]
+
+        reference_author = None
+        if message.reference is not None and isinstance(message.reference.resolved, discord.Message):
+            reference_author = message.reference.resolved.author.id
+
+        self._write(MESSAGE, b"".join([
+            _MESSAGE.pack(self.anonymize(message.channel.id), self.anonymize(message.author.id),
+                          self.anonymize(reference_author), len(mentions)),
+            struct.pack(f">{len(mentions)}Q", *mentions),
+            _LONG.pack(len(content)),
+            content,
+        ]))
+
+    def record_command(self, interaction: discord.Interaction):
+        """
+        Records a command.
+        :param interaction: The interaction the command was run with.
+        :return: Nothing
+        """
+        if interaction.command is None:
+            return
+
+        # anything with an id (members, channels, roles) is kept as just its anonymized id
+        options = {
+            name: {"id": self.anonymize(value.id)} if hasattr(value, "id") else value
+            for name, value in interaction.namespace
+        }
+
+        name = interaction.command.qualified_name.encode("utf8")
+        encoded_options = json.dumps(options, separators=(",", ":")).encode("utf8")
+
+        self._write(COMMAND, b"".join([
+            _COMMAND.pack(self.anonymize(interaction.channel_id), self.anonymize(interaction.user.id)),
+            _SHORT.pack(len(name)), name,
+            _LONG.pack(len(encoded_options)), encoded_options,
+        ]))
+
+
+def _read_exact(f: BinaryIO, n: int) -> bytes:
+    data = f.read(n)
+    if len(data) < n:
+        raise EOFError
+    return data
+
+
+def read_log(f: BinaryIO) -> Iterator[Tuple[int, float, Dict[str, Any]]]:
+    """
+    Reads a log one record at a time. A truncated last record, e.g. from a crash, is ignored.
+    :param f: A binary file positioned at the start of the log.
+    :return: An iterator of (kind, seconds since the recording started, fields)
+    """
+    magic, version = _HEADER.unpack(_read_exact(f, _HEADER.size))
+
+    if magic != MAGIC or version > VERSION:
+        raise ValueError("not a replay log, or one from a newer version")
+
+    while True:
+        try:
+            kind, t = _RECORD.unpack(_read_exact(f, _RECORD.size))
+
+            if kind == HELLO:
+                (bot_id,) = _HELLO.unpack(_read_exact(f, _HELLO.size))
+                yield kind, t, {"bot_id": bot_id}
+
+            elif kind == MESSAGE:
+                channel, author, reference_author, n = _MESSAGE.unpack(_read_exact(f, _MESSAGE.size))
+                mentions = list(struct.unpack(f">{n}Q", _read_exact(f, 8 * n)))
+                (length,) = _LONG.unpack(_read_exact(f, _LONG.size))
+                content = _read_exact(f, length).decode("utf8")
+
+                yield kind, t, {"channel": channel, "author": author, "reference_author": reference_author or None,
+                                "mentions": mentions, "content": content}
+
+            elif kind == COMMAND:
+                channel, user = _COMMAND.unpack(_read_exact(f, _COMMAND.size))
+                (length,) = _SHORT.unpack(_read_exact(f, _SHORT.size))
+                name = _read_exact(f, length).decode("utf8")
+                (length,) = _LONG.unpack(_read_exact(f, _LONG.size))
+                options = json.loads(_read_exact(f, length))
+
+                yield kind, t, {"channel": channel, "user": user, "name": name, "options": options}
+
+            else:
+                raise ValueError(f"unknown record kind {kind}")
+
+        except EOFError:
+            return
+
+
+class _StubUser:
+    def __init__(self, id: int):
+        self.id = id
+        self.name = f"user{id % 10000}"
+        self.display_name = self.name
+        self.mention = f"<@{id}>"
+        self.bot = False
+
+
+class _StubReference:
+    def __init__(self, resolved):
+        self.resolved = resolved
+
+
+class _StubMessage:
+    def __init__(self, replay: "Replay", channel: "_StubChannel", author: _StubUser, content: str,
+                 mentions: List[_StubUser], reference: Optional[_StubReference] = None):
+        self._replay = replay
+        self.id = replay.next_id()
+        self.channel = channel
+        self.author = author
+        self.content = content
+        self.mentions = mentions
+        self.raw_mentions = [x.id for x in mentions]
+        self.reference = reference
+        self.attachments = []
+        self.guild = None
+
+    async def add_reaction(self, emoji):
+        self._replay.output("react", str(emoji))
+
+
+class _StubChannel:
+    def __init__(self, replay: "Replay", id: int):
+        self._replay = replay
+        self.id = id
+        self.messages = []
+
+    async def send(self, content=None, *, embed=None, file=None, view=None, **kwargs):
+        self._replay.output("send", content, embed, file)
+        message = _StubMessage(self._replay, self, self._replay.bot_user, content or "", [])
+        self.messages.append(message)
+        return message
+
+    async def history(self, limit=100):
+        for message in reversed(self.messages[-limit:]):
+            yield message
+
+
+class _StubInteractionResponse:
+    def __init__(self, replay: "Replay"):
+        self._replay = replay
+        self._done = False
+
+    def is_done(self):
+        return self._done
+
+    async def send_message(self, content=None, *, embed=None, file=None, view=None, **kwargs):
+        self._done = True
+        self._replay.output("send", content, embed, file)
+
+    async def defer(self, **kwargs):
+        self._done = True
+
+
+class _StubInteraction:
+    def __init__(self, replay: "Replay", channel: _StubChannel, user: _StubUser, command):
+        self._replay = replay
+        self.client = replay.client
+        self.channel = channel
+        self.channel_id = channel.id
+        self.user = user
+        self.command = command
+        self.created_at = datetime.now(tz=timezone.utc)
+        self.extras = {"received": time.perf_counter()}
+        self.response = _StubInteractionResponse(replay)
+        self.guild = None
+
+    async def edit_original_response(self, *, content=None, embed=None, **kwargs):
+        self._replay.output("edit", content, embed)
+
+    async def original_response(self):
+        return _StubMessage(self._replay, self.channel, self._replay.bot_user, "", [])
+
+    async def followup_send(self, content=None, *, embed=None, file=None, **kwargs):
+        self._replay.output("send", content, embed, file)
+
+
+class _CommandCollector:
+    # stands in for a command tree, to find the commands by name
+    def __init__(self):
+        self.commands = {}
+
+    def add_command(self, command):
+        if isinstance(command, discord.app_commands.Group):
+            for sub in command.walk_commands():
+                if not isinstance(sub, discord.app_commands.Group):
+                    self.commands[sub.qualified_name] = sub
+        else:
+            self.commands[command.qualified_name] = command
+
+
+def _percentile(ordered: List[float], p: float) -> float:
+    return ordered[max(0, -(-len(ordered) * p // 100) - 1)] if ordered else 0.0
+
+
+class Replay:
+    """
+    Feeds a log through the real Amadeus handlers, with the discord side stubbed out.
+    Nothing is sent anywhere and no state is saved; what the bot would have sent is collected instead.
+    """
+
+    def __init__(self, speed: Optional[float] = None, seed=0):
+        """
+        Creates a new Replay
+        :param speed: How fast to replay, e.g. 1 for the speed it was recorded at. None replays as fast as possible.
+        :param seed: The seed for the random number generator, so replays are repeatable.
+        """
+        from .client import Amadeus
+
+        class ReplayAmadeus(Amadeus):
+            def save_state(self, *args, **kwargs):
+                pass
+
+        self.speed = speed
+        self.seed = seed
+        self.client = ReplayAmadeus(intents=discord.Intents.default())
+        self.bot_user = _StubUser(0)
+        self.channels: Dict[int, _StubChannel] = {}
+        self.results = []
+
+        collector = _CommandCollector()
+        commands.add_commands(collector)
+        self.commands = collector.commands
+
+        self._outputs = None
+        self._ids = 0
+
+    def next_id(self) -> int:
+        self._ids += 1
+        return self._ids
+
+    def output(self, kind: str, content=None, embed=None, file=None):
+        """
+        Notes down something the bot would have sent for the current event.
+        :return: Nothing
+        """
+        entry = {"kind": kind}
+
+        if content is not None:
+            entry["content"] = content
+        if embed is not None:
+            entry["embed"] = embed.to_dict()
+        if file is not None:
+            entry["file"] = file.filename
+
+        self._outputs.append(entry)
+
+    def _channel(self, id: int) -> _StubChannel:
+        if id not in self.channels:
+            self.channels[id] = _StubChannel(self, id)
+        return self.channels[id]
+
+    def _set_bot_id(self, bot_id: int):
+        self.bot_user = _StubUser(bot_id)
+        self.bot_user.bot = True
+        self.client._connection.user = self.bot_user
+
+    def _options(self, options: Dict[str, Any]) -> Dict[str, Any]:
+        return {k: _StubUser(v["id"]) if isinstance(v, dict) and "id" in v else v for k, v in options.items()}
+
+    async def _message(self, fields) -> Optional[str]:
+        channel = self._channel(fields["channel"])
+        author = self.bot_user if fields["author"] == self.bot_user.id else _StubUser(fields["author"])
+
+        reference = None
+        if fields["reference_author"] is not None:
+            resolved = _StubMessage(self, channel, _StubUser(fields["reference_author"]), "", [])
+            reference = _StubReference(resolved)
+
+        message = _StubMessage(self, channel, author, fields["content"],
+                               [_StubUser(x) for x in fields["mentions"]], reference)
+        channel.messages.append(message)
+
+        fired = await self.client.dispatch_message(message)
+        return None if fired is None else fired.name
+
+    async def _command(self, fields) -> Optional[str]:
+        command = self.commands.get(fields["name"])
+
+        if command is None:
+            return None
+
+        interaction = _StubInteraction(self, self._channel(fields["channel"]), _StubUser(fields["user"]), command)
+        args = (interaction,) if command.binding is None else (command.binding, interaction)
+
+        # checks like owner-only ones are skipped, as the recorded command already passed them
+        await command.callback(*args, **self._options(fields["options"]))
+        return "/" + fields["name"]
+
+    async def run(self, f: BinaryIO) -> Dict[str, Any]:
+        """
+        Replays a log.
+        :param f: A binary file positioned at the start of the log.
+        :return: The results: what happened for each event, and overall stats.
+        """
+        random.seed(self.seed)
+        response.selection.seed_streams(self.seed)
+
+        self.client.forgotten_images.scan()
+
+        latencies = []
+        start = time.perf_counter()
+
+        for kind, t, fields in read_log(f):
+            if kind == HELLO:
+                self._set_bot_id(fields["bot_id"])
+                continue
+
+            if self.speed is not None:
+                delay = start + t / self.speed - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+
+            self._outputs = []
+            event_start = time.perf_counter()
+
+            try:
+                if kind == MESSAGE:
+                    fired = await self._message(fields)
+                else:
+                    fired = await self._command(fields)
+                error = None
+            except Exception as e:
+                fired = None
+                error = f"{type(e).__name__}: {e}"
+
+            latencies.append(time.perf_counter() - event_start)
+
+            result = {"event": len(self.results), "kind": "message" if kind == MESSAGE else "command",
+                      "fired": fired, "outputs": self._outputs}
+            if error is not None:
+                result["error"] = error
+
+            self.results.append(result)
+
+        elapsed = time.perf_counter() - start
+        ordered = sorted(latencies)
+
+        return {
+            "events": self.results,
+            "stats": {
+                "events": len(latencies),
+                "seconds": elapsed,
+                "events_per_second": len(latencies) / elapsed if elapsed else 0.0,
+                "latency_ms": {f"p{p}": _percentile(ordered, p) * 1000 for p in (50, 95, 99)},
+                "max_latency_ms": (ordered[-1] if ordered else 0.0) * 1000,
+            }
+        }
+
+
+def diff_results(old: Dict[str, Any], new: Dict[str, Any]) -> List[str]:
+    """
+    Compares the results of replaying the same log on two versions of the code.
+    :param old: The results from the old version.
+    :param new: The results from the new version.
+    :return: A description of every event that went differently.
+    """
+    differences = []
+
+    for a, b in zip(old["events"], new["events"]):
+        if a["fired"] != b["fired"]:
+            differences.append(f"event {a['event']}: {a['fired']} fired before, {b['fired']} fires now")
+        elif a["outputs"] != b["outputs"]:
+            differences.append(f"event {a['event']}: {a['fired']} sent something different")
+
+    if len(old["events"]) != len(new["events"]):
+        differences.append(f"{len(old['events'])} events before, {len(new['events'])} now")
+
+    return differences
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m amadeus.replay", description="Replays recorded traffic.")
+    parser.add_argument("log", nargs="?", help="The log to replay.")
+    parser.add_argument("--speed", default="max",
+                        help="How fast to replay: max, or a multiple of the recorded speed, e.g. 1.")
+    parser.add_argument("--seed", type=int, default=0, help="The random seed, so replays are repeatable.")
+    parser.add_argument("--out", help="Where to save the results, for diffing later.")
+    parser.add_argument("--diff", nargs=2, metavar=("OLD", "NEW"), help="Compare two saved results.")
+    args = parser.parse_args(argv)
+
+    if args.diff:
+        with open(args.diff[0]) as a, open(args.diff[1]) as b:
+            differences = diff_results(json.load(a), json.load(b))
+
+        print("\n".join(differences) if differences else "No differences")
+        return 1 if differences else 0
+
+    if args.log is None:
+        parser.error("a log is needed unless diffing")
+
+    speed = None if args.speed == "max" else float(args.speed)
+
+    async def replay():
+        with open(args.log, "rb") as f:
+            return await Replay(speed=speed, seed=args.seed).run(f)
+
+    results = asyncio.run(replay())
+    stats = results["stats"]
+
+    print(f"{stats['events']} events in {stats['seconds']:.2f}s ({stats['events_per_second']:.1f}/s)")
+    print("latency " + ", ".join(f"{k} {v:.2f}ms" for k, v in stats["latency_ms"].items())
+          + f", max {stats['max_latency_ms']:.2f}ms")
+
+    fired = {}
+    for event in results["events"]:
+        if event["fired"] is not None:
+            fired[event["fired"]] = fired.get(event["fired"], 0) + 1
+
+    for name, count in sorted(fired.items(), key=lambda x: -x[1]):
+        print(f"  {name}: {count}")
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f)
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
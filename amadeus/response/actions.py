@@ -1,16 +1,25 @@
-import random
+import itertools
+import logging
 import re
-from typing import Union, List, Callable
+from typing import Union, List, Callable, Set, Optional, Tuple
 
 import discord
 
 from amadeus import embeds
+from amadeus.views import PageView
+from . import offload, patterns, selection
+
+log = logging.getLogger(__name__)
+
+_WORD = re.compile(r"\S+")
 
 class Action:
     """
     Class that holds an action that a bot can take.
     """
 
+    __slots__ = ()
+
     async def apply(self, msg: discord.Message, bot: discord.Client):
         """
         Runs this action on a bot.
@@ -20,6 +29,14 @@ class Action:
         """
         raise NotImplemented
 
+    def required_intents(self) -> Set[str]:
+        """
+        Gives the gateway intents this action needs to work, beyond what its trigger needs,
+        by their names in discord.Intents.
+        :return: The names of the intents.
+        """
+        return set()
+
 
 class LiteralSendAction(Action):
     """
@@ -27,6 +44,8 @@ class LiteralSendAction(Action):
      e.g. sending "you're welcome."
      """
 
+    __slots__ = ("phrase",)
+
     def __init__(self, phrase):
         """
         Creates a new LiteralSendAction
@@ -42,8 +61,13 @@ class RegexSendAction(Action):
     """
     An action that sends the original message with a re.sub applied to it.
     e.g. "i'm gay" becoming "hi gay, i'm dad"
+    The regex is applied to the content as it was written, not the folded content RegexTrigger matches against,
+    so the reply keeps the user's own text. If the regex only matches the folded content, nothing is sent.
+    RE2 is used if the linear engine is enabled and RE2 supports the regex.
     """
 
+    __slots__ = ("regex", "replacement", "flags")
+
     def __init__(self, regex, replacement, flags=re.IGNORECASE | re.MULTILINE):
         """
         Creates a new RegexSendAction
@@ -55,9 +79,28 @@ class RegexSendAction(Action):
         self.replacement = replacement
         self.flags = flags
 
+        for problem in patterns.analyze(regex, flags):
+            log.warning("Regex %r: %s", regex, problem)
+
     async def apply(self, msg: discord.Message, bot: discord.Client):
-        message = re.sub(self.regex, self.replacement, msg.content, flags=self.flags)
-        await msg.channel.send(message)
+        content = msg.content
+        compiled = patterns.compile_linear(self.regex, self.flags) if patterns.use_linear_engine else None
+
+        if compiled is not None:
+            result = compiled.subn(self.replacement, content)
+        elif offload.offloader is not None:
+            result = await offload.offloader.subn(self.regex, self.replacement, self.flags, content)
+        else:
+            result = re.subn(self.regex, self.replacement, content, flags=self.flags)
+
+        # either the regex took too long, or the trigger only matched once the content was folded
+        if result is None or result[1] == 0:
+            return
+
+        await msg.channel.send(result[0])
+
+    def required_intents(self) -> Set[str]:
+        return {"message_content"}
 
 
 class RandomLiteralAction(Action):
@@ -65,19 +108,25 @@ class RandomLiteralAction(Action):
     An action that says one of a random literals.
     e.g. "uwu" or "owo"
 
-    Any literal that is a function will be evaluated with the message as an argument.
+    Any literal that is a function will be evaluated with the message as an argument, but only if it's picked.
     """
 
-    def __init__(self, literals: List[Union[str, Callable[[discord.Message], str]]]):
+    __slots__ = ("literals", "stream")
+
+    def __init__(self, literals: List[Union[str, Callable[[discord.Message], str]]],
+                 weights: Optional[List[float]] = None, stream="literals"):
         """
         Create a new RandomLiteralAction
         :param literals: A list of literals or functions to be evaluated. Functions will be given the message as an argument, and should return a string.
+        :param weights: How likely each literal is to be picked, relative to the others. Defaults to all the same.
+        :param stream: The name of the random stream to pick from.
         """
-        self.literals = literals
+        self.literals = selection.AliasTable(literals, weights)
+        self.stream = stream
 
     async def apply(self, msg: discord.Message, bot: discord.Client):
-        literals = [x if type(x) is str else x(msg) for x in self.literals]
-        await msg.channel.send(random.choice(literals))
+        literal = self.literals.pick(selection.stream(self.stream))
+        await msg.channel.send(literal if type(literal) is str else literal(msg))
 
 
 class EvaluateStringAction(Action):
@@ -85,6 +134,8 @@ class EvaluateStringAction(Action):
     An action that will return a string based on a given input function being passed in a function
     """
 
+    __slots__ = ("func",)
+
     def __init__(self, func: Callable[[discord.Message], str]):
         """
         Creates a new EvaluateStringAction
@@ -96,52 +147,107 @@ class EvaluateStringAction(Action):
         s = self.func(msg)
         await msg.channel.send(s)
 
+    def required_intents(self) -> Set[str]:
+        # there's no telling what the function reads, so assume it's the content
+        return {"message_content"}
+
 
 class ReactAction(Action):
     """
     An action that reacts to the message with an emoji.
-    This only supports server emojis, and not base emojis.
-    TODO: fix this ^
+    This supports both server emojis, by id, and unicode emojis.
     """
-    def __init__(self, emoji: int):
+
+    __slots__ = ("emoji",)
+
+    def __init__(self, emoji: Union[int, str]):
         """
         Creates a new ReactAction
-        :param emoji: the id of the emoji to react.
+        :param emoji: the id of the server emoji to react with, or the unicode emoji.
         """
         self.emoji = emoji
 
     async def apply(self, msg: discord.Message, bot: discord.Client):
-        await msg.add_reaction(bot.get_emoji(self.emoji))
+        resolver = getattr(bot, "emoji_resolver", None)
+
+        if resolver is not None:
+            await msg.add_reaction(resolver.resolve(self.emoji))
+        elif isinstance(self.emoji, str):
+            await msg.add_reaction(self.emoji)
+        else:
+            await msg.add_reaction(discord.PartialEmoji(name="_", id=self.emoji))
 
 
 class SendRandomActionEmbedAction(Action):
     """
     An action that gives a random possibility from a list, with an optional custom embed generator and name modifier
     Possibilties are strings that get formatted with two things, the actioner (0) and the actionee (1).
+    At most MAX_ACTIONEES different actionees are acted on, and output too long for one embed is split into pages.
     """
 
-    def __init__(self, possibilities: List[str], embed_generator=embeds.action_embed, name_modifier=embeds.boldifier):
+    MAX_ACTIONEES = 20
+    # longer names are cut short
+    MAX_NAME_LENGTH = 100
+
+    __slots__ = ("possibilities", "embed_generator", "name_modifier", "stream")
 
-        self.possibilities = possibilities
+    def __init__(self, possibilities: List[str], embed_generator=embeds.action_embed, name_modifier=embeds.boldifier,
+                 weights: Optional[List[float]] = None, stream="actions"):
+
+        self.possibilities = selection.AliasTable(possibilities, weights)
         self.embed_generator = embed_generator
         self.name_modifier = name_modifier
+        self.stream = stream
+
+    def _actionees(self, msg: discord.Message, bot: discord.Client) -> Tuple[List[str], bool]:
+        """
+        Works out who is being acted on: whoever was mentioned, or otherwise every word after the first.
+        Duplicates are dropped, and only as many of the message as is needed is looked at.
+        :param msg: The message.
+        :param bot: The client.
+        :return: Up to MAX_ACTIONEES actionees, and whether there were more than that.
+        """
+        if msg.mentions:
+            names = (x.name for x in msg.mentions)
+        else:
+            words = _WORD.finditer(msg.content)
+            next(words, None)
+            names = (x.group() for x in words)
+
+        actionees = {}
+
+        for name in names:
+            name = name[:self.MAX_NAME_LENGTH]
+
+            if name in actionees:
+                continue
+
+            if len(actionees) == self.MAX_ACTIONEES:
+                return list(actionees), True
+
+            actionees[name] = None
+
+        return list(actionees) or [bot.user.name], False
 
     async def apply(self, msg: discord.Message, bot: discord.Client):
 
         actioner = self.name_modifier(msg.author.name)
-        actionees = [x.name for x in msg.mentions]
+        actionees, more = self._actionees(msg, bot)
+
+        rng = selection.stream(self.stream)
 
-        if len(actionees) == 0:
-            actionees = msg.content.split(" ")[1:]
+        lines = (self.possibilities.pick(rng).format(actioner, self.name_modifier(x)) for x in actionees)
 
-        if len(actionees) == 0:
-            actionees = [bot.user.name]
+        if more:
+            lines = itertools.chain(lines, ["...and that's enough for now."])
 
-        out = "\n\n".join(
-            [
-                random.choice(self.possibilities).format(actioner, self.name_modifier(x)) for x in actionees
-            ]
-        )
+        pages = [self.embed_generator(x) for x in embeds.chunk_lines(lines, separator="\n\n")]
 
-        await msg.channel.send(embed=self.embed_generator(out))
+        if len(pages) == 1:
+            await msg.channel.send(embed=pages[0])
+        else:
+            view = PageView(pages)
+            view.message = await msg.channel.send(embed=pages[0], view=view)
 
+    def required_intents(self) -> Set[str]:
+        return {"message_content"}
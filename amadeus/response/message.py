@@ -0,0 +1,95 @@
+import re
+import unicodedata
+from functools import cached_property
+
+import discord
+
+
+# apostrophes and quotes that phone keyboards like to swap in for the plain ascii ones
+_QUOTE_FOLDS = str.maketrans({
+    "‘": "'",
+    "’": "'",
+    "ʼ": "'",
+    "“": '"',
+    "”": '"',
+})
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def fold(text: str) -> str:
+    """
+    Folds unicode variants of characters into their plain forms, for regexes.
+    This applies NFKC and folds fancy quotes into ascii ones, but keeps case and line breaks,
+    as regexes have their own flags for those.
+    :param text: The text to fold.
+    :return: The folded text.
+    """
+    return unicodedata.normalize("NFKC", text).translate(_QUOTE_FOLDS)
+
+
+def normalize(text: str) -> str:
+    """
+    Normalizes text for case-insensitive matching.
+    This folds the text (see fold), casefolds it and collapses whitespace.
+    :param text: The text to normalize.
+    :return: The normalized text.
+    """
+    return _WHITESPACE.sub(" ", fold(text).casefold()).strip()
+
+
+class NormalizedMessage:
+    """
+    A wrapper around a message that normalizes and folds its content the first time each is needed,
+    and then keeps them.
+    It also keeps the result of every trigger checked against the message (see Trigger.evaluate).
+    Everything else is passed straight through to the message, so this can be used anywhere a message is.
+    """
+
+    def __init__(self, message: discord.Message):
+        """
+        Creates a new NormalizedMessage
+        :param message: The message to wrap.
+        """
+        self.message = message
+        self.trigger_results = {}
+
+    def __getattr__(self, name):
+        return getattr(self.message, name)
+
+    @cached_property
+    def normalized_content(self) -> str:
+        """
+        The content of the message, run through normalize.
+        """
+        # the same as normalize, but reusing the folded content if it's already been worked out
+        return _WHITESPACE.sub(" ", self.folded_content.casefold()).strip()
+
+    @cached_property
+    def folded_content(self) -> str:
+        """
+        The content of the message, run through fold.
+        """
+        return fold(self.message.content)
+
+
+def normalized_content(msg) -> str:
+    """
+    Gets the normalized content of a message, using the cached copy if the message is a NormalizedMessage.
+    :param msg: The message, either a discord.Message or a NormalizedMessage.
+    :return: The normalized content.
+    """
+    if isinstance(msg, NormalizedMessage):
+        return msg.normalized_content
+    return normalize(msg.content)
+
+
+def folded_content(msg) -> str:
+    """
+    Gets the folded content of a message, using the cached copy if the message is a NormalizedMessage.
+    :param msg: The message, either a discord.Message or a NormalizedMessage.
+    :return: The folded content.
+    """
+    if isinstance(msg, NormalizedMessage):
+        return msg.folded_content
+    return fold(msg.content)
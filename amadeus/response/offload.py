@@ -0,0 +1,209 @@
+import asyncio
+import logging
+import multiprocessing
+import re
+from typing import Optional, Tuple
+
+log = logging.getLogger(__name__)
+
+
+def _search(regex, flags, content) -> bool:
+    return re.search(regex, content, flags=flags) is not None
+
+
+def _subn(regex, replacement, flags, content) -> Tuple[str, int]:
+    return re.subn(regex, replacement, content, flags=flags)
+
+
+def _work(connection):
+    # runs in the worker process: takes (function, arguments) off the pipe, and sends back (succeeded, result)
+    while True:
+        try:
+            func, args = connection.recv()
+        except EOFError:
+            return
+
+        try:
+            result = (True, func(*args))
+        except Exception as e:
+            result = (False, e)
+
+        connection.send(result)
+
+
+def _context():
+    # the bot has threads running (the watchdog, the log writer), and forking a process with threads isn't safe,
+    # so workers come from a fork server started before any of that, or are spawned where there's no fork server
+    try:
+        context = multiprocessing.get_context("forkserver")
+    except ValueError:
+        return multiprocessing.get_context("spawn")
+
+    context.set_forkserver_preload([__name__])
+    return context
+
+
+class _Worker:
+    """
+    A worker process, and the pipe to it. It runs one function at a time.
+    """
+
+    def __init__(self, context):
+        self.connection, child = context.Pipe()
+        self.process = context.Process(target=_work, args=(child,), daemon=True)
+        self.process.start()
+        child.close()
+
+    async def run(self, func, args):
+        """
+        Runs a function in the worker.
+        :return: Whether it succeeded, and what it returned or raised.
+        """
+        loop = asyncio.get_running_loop()
+        ready = loop.create_future()
+        fd = self.connection.fileno()
+
+        loop.add_reader(fd, lambda: ready.done() or ready.set_result(None))
+
+        try:
+            self.connection.send((func, args))
+            await ready
+        finally:
+            loop.remove_reader(fd)
+
+        return self.connection.recv()
+
+    def kill(self):
+        self.process.kill()
+        self.process.join(1)
+        self.connection.close()
+
+
+class RegexOffloader:
+    """
+    Runs regexes over long messages in a pool of worker processes, so a regex that backtracks badly
+    on a huge pasted message can't stall the event loop.
+    Short messages are still matched inline, as sending them to a worker would cost more than matching them.
+
+    It has to be processes rather than threads: the re module holds the GIL while it matches.
+    A regex that runs too long only costs its own worker, which is killed and replaced; the others carry on.
+    """
+
+    def __init__(self, threshold=1000, timeout=1.0, workers=2):
+        """
+        Creates a new RegexOffloader
+        :param threshold: How long, in characters, a message has to be before it's sent to a worker.
+        :param timeout: How long, in seconds, a worker gets before the regex is given up on.
+        Time spent waiting for a free worker doesn't count.
+        :param workers: How many worker processes to use.
+        """
+        self.threshold = threshold
+        self.timeout = timeout
+        self.workers = workers
+        self._context = None
+        self._idle: Optional[asyncio.Queue] = None
+        self._all = set()
+
+    async def search(self, regex, flags, content: str) -> bool:
+        """
+        Works like re.search, but a regex that takes too long counts as not matching.
+        :return: Whether the regex matched.
+        """
+        if len(content) < self.threshold:
+            return _search(regex, flags, content)
+
+        result = await self._run(_search, regex, flags, content)
+        return bool(result)
+
+    async def subn(self, regex, replacement, flags, content: str) -> Optional[Tuple[str, int]]:
+        """
+        Works like re.subn.
+        :return: The substituted string and the number of substitutions, or None if the regex took too long.
+        """
+        if len(content) < self.threshold:
+            return _subn(regex, replacement, flags, content)
+
+        return await self._run(_subn, regex, replacement, flags, content)
+
+    def _spawn(self) -> _Worker:
+        worker = _Worker(self._context)
+        self._all.add(worker)
+        return worker
+
+    def _retire(self, worker: _Worker):
+        self._all.discard(worker)
+        worker.kill()
+
+    async def _run(self, func, *args):
+        if self._idle is None:
+            self._context = self._context or _context()
+            self._idle = asyncio.Queue()
+
+            for _ in range(self.workers):
+                self._idle.put_nowait(self._spawn())
+
+        idle = self._idle
+        worker = await idle.get()
+        healthy = False
+
+        try:
+            succeeded, value = await asyncio.wait_for(worker.run(func, args), self.timeout)
+            healthy = True
+        except asyncio.TimeoutError:
+            log.warning("Regex %r timed out after %ss, treating it as no match", args[0], self.timeout)
+            return None
+        except (EOFError, OSError) as e:
+            log.warning("Regex worker died (%s), treating it as no match", e)
+            return None
+        finally:
+            # a worker that timed out, died, or was cancelled mid-run can't be trusted with the next regex
+            if not healthy:
+                self._retire(worker)
+
+            if idle is self._idle:
+                idle.put_nowait(worker if healthy else self._spawn())
+            elif healthy:
+                # shut down while this was running
+                self._retire(worker)
+
+        if not succeeded:
+            raise value
+
+        return value
+
+    def shutdown(self):
+        """
+        Stops the worker processes.
+        :return: Nothing
+        """
+        self._idle = None
+
+        for worker in list(self._all):
+            self._retire(worker)
+
+
+# The offloader used by regex triggers and actions, or None to always match inline.
+offloader: Optional[RegexOffloader] = None
+
+
+def enable_offloading(**options):
+    """
+    Starts sending regexes over long messages to worker processes.
+    :param options: Options for the RegexOffloader.
+    :return: Nothing
+    """
+    global offloader
+    offloader = RegexOffloader(**options)
+
+
+def disable_offloading():
+    """
+    Goes back to matching every regex inline, and stops the worker processes.
+    :return: Nothing
+    """
+    global offloader
+
+    if offloader is not None:
+        offloader.shutdown()
+
+    offloader = None
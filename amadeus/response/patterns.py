@@ -0,0 +1,218 @@
+"""
+Load-time checks and rewrites for the regexes that get run against message content.
+
+Python's re backtracks, so a pattern with nested quantifiers, or with more than one unbounded wildcard,
+can take superlinear time on a long message. The analyzer points those out when the responses are loaded.
+For patterns used with re.search, a leading ^.* or trailing .*$ only changes where the match is
+considered to start or end, not whether there is one, so they're dropped where that's safe.
+
+There is also an optional linear-time mode, backed by RE2 (the google-re2 package) if it's installed.
+"""
+import logging
+import re
+from functools import lru_cache
+from typing import List, Optional, Tuple
+
+try:
+    from re import _parser as sre_parse
+except ImportError:
+    import sre_parse
+
+try:
+    import re2
+except ImportError:
+    re2 = None
+
+log = logging.getLogger(__name__)
+
+
+_MAXREPEAT = sre_parse.MAXREPEAT
+_REPEATS = {sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT, getattr(sre_parse, "POSSESSIVE_REPEAT", None)} - {None}
+
+# Whether regex triggers should use RE2 for the patterns it can handle.
+use_linear_engine = False
+
+
+def enable_linear_engine() -> bool:
+    """
+    Switches regex triggers over to RE2, which matches in linear time, for every pattern RE2 supports.
+    Patterns RE2 can't handle (e.g. backreferences) keep using re.
+    :return: Whether RE2 is available. If not, nothing changes.
+    """
+    global use_linear_engine
+
+    if re2 is None:
+        log.warning("google-re2 is not installed, so regexes will keep using re")
+        return False
+
+    use_linear_engine = True
+    return True
+
+
+def _is_unbounded(item) -> bool:
+    op, av = item
+    return op in _REPEATS and av[1] == _MAXREPEAT
+
+
+def _is_wildcard(item) -> bool:
+    # .* or .+ (or their lazy versions)
+    op, av = item
+    return _is_unbounded(item) and len(av[2]) == 1 and av[2][0][0] == sre_parse.ANY
+
+
+def _children(item):
+    op, av = item
+
+    if op in _REPEATS:
+        return [av[2]]
+    if op == sre_parse.SUBPATTERN:
+        return [av[3]]
+    if op == sre_parse.BRANCH:
+        return av[1]
+    if op in (sre_parse.ASSERT, sre_parse.ASSERT_NOT):
+        return [av[1]]
+    if op == sre_parse.GROUPREF_EXISTS:
+        return [x for x in av[1:] if x is not None]
+
+    return []
+
+
+def _contains_repeat(subpattern) -> bool:
+    for item in subpattern:
+        op, av = item
+        if op in _REPEATS and av[1] > 1:
+            return True
+        if any(_contains_repeat(x) for x in _children(item)):
+            return True
+    return False
+
+
+def _find_problems(subpattern, problems: List[str]):
+    wildcards = 0
+
+    for item in subpattern:
+        op, av = item
+
+        if _is_wildcard(item):
+            wildcards += 1
+
+        if op in _REPEATS and av[1] > 1 and _contains_repeat(av[2]):
+            problems.append("nested quantifiers can backtrack exponentially")
+
+        for child in _children(item):
+            _find_problems(child, problems)
+
+    if wildcards > 1:
+        problems.append("more than one unbounded wildcard can backtrack polynomially")
+
+
+def _trim_anchored_wildcards(data, flags) -> list:
+    # the ^.* and .*$ that simplify_for_search drops can't make the rest backtrack either, so they're not counted.
+    # this matters for regexes used with re.sub, which keep them to replace the whole line, e.g. ^.*(meow).*$
+    data = list(data)
+
+    if not flags & (re.MULTILINE | re.DOTALL):
+        return data
+
+    if len(data) > 2 and data[0] == (sre_parse.AT, sre_parse.AT_BEGINNING) and _is_wildcard(data[1]):
+        del data[1]
+
+    if len(data) > 2 and data[-1] == (sre_parse.AT, sre_parse.AT_END) and _is_wildcard(data[-2]):
+        del data[-2]
+
+    return data
+
+
+def analyze(regex: str, flags=0) -> List[str]:
+    """
+    Looks for constructs in a regex that can make re take superlinear time.
+    :param regex: The regex.
+    :param flags: The flags the regex is used with.
+    :return: A description of each problem found. Empty if there are none.
+    """
+    problems = []
+    parsed = sre_parse.parse(regex, flags)
+
+    _find_problems(_trim_anchored_wildcards(parsed.data, flags), problems)
+
+    # a leading wildcard that isn't anchored is retried from every position re.search tries
+    if parsed.data and _is_wildcard(parsed.data[0]):
+        problems.append("a leading unanchored wildcard is rescanned from every starting position")
+
+    return list(dict.fromkeys(problems))
+
+
+def simplify_for_search(regex: str, flags=0) -> str:
+    """
+    Drops a leading ^.* and a trailing .*$ from a regex that is only used to check for a match with re.search.
+    These don't change whether the regex matches, as long as the wildcard can reach every line,
+    i.e. with re.MULTILINE or re.DOTALL. Anything else is left as it is.
+    :param regex: The regex.
+    :param flags: The flags the regex is used with.
+    :return: The simplified regex, or the same regex if it couldn't be simplified.
+    """
+    if not flags & (re.MULTILINE | re.DOTALL):
+        return regex
+
+    original = regex
+    data = sre_parse.parse(regex, flags).data
+    at_beginning = (sre_parse.AT, sre_parse.AT_BEGINNING)
+    at_end = (sre_parse.AT, sre_parse.AT_END)
+
+    if (regex.startswith("^.*") and len(data) > 2 and data[0] == at_beginning and _is_wildcard(data[1])
+            and data[1][1][0] == 0):
+        # skip a lazy marker too, as in ^.*?
+        regex = regex[4:] if regex.startswith("^.*?") else regex[3:]
+
+    if (regex.endswith(".*$") and not regex.endswith("\\.*$") and len(data) > 2 and data[-1] == at_end
+            and _is_wildcard(data[-2]) and data[-2][1][0] == 0):
+        regex = regex[:-3]
+
+    # make sure the rewrite didn't break anything, e.g. by cutting an escape in half
+    try:
+        re.compile(regex, flags)
+    except re.error:
+        return original
+
+    return regex
+
+
+@lru_cache(maxsize=None)
+def compile_linear(regex: str, flags=0):
+    """
+    Compiles a regex with RE2, so it's matched in linear time.
+    :param regex: The regex.
+    :param flags: The re flags the regex is used with. Only IGNORECASE, MULTILINE and DOTALL are supported.
+    :return: The compiled regex, or None if RE2 isn't installed or can't handle the regex.
+    Results are cached, so this is cheap to call on every match.
+    """
+    if re2 is None:
+        return None
+
+    if flags & ~(re.IGNORECASE | re.MULTILINE | re.DOTALL | re.UNICODE):
+        return None
+
+    inline = "".join(c for flag, c in [(re.IGNORECASE, "i"), (re.MULTILINE, "m"), (re.DOTALL, "s")] if flags & flag)
+
+    try:
+        return re2.compile(f"(?{inline}){regex}" if inline else regex)
+    except re2.error:
+        return None
+
+
+def prepare_search(regex: str, flags=0, name: Optional[str] = None) -> Tuple[str, List[str]]:
+    """
+    Gets a regex ready to be used with re.search on message content: simplifies it,
+    and reports anything about it that could still make it slow.
+    :param regex: The regex.
+    :param flags: The flags the regex is used with.
+    :param name: What to call the regex when reporting problems. Defaults to the regex itself.
+    :return: The simplified regex, and the problems that remain with it.
+    """
+    simplified = simplify_for_search(regex, flags)
+    problems = analyze(simplified, flags)
+
+    for problem in problems:
+        log.warning("Regex %s: %s", name or repr(regex), problem)
+
+    return simplified, problems
@@ -1,13 +1,18 @@
 from .actions import *
 from .triggers import *
 
-import random
+from typing import Set, Union
+
+from . import selection
 
 class Response:
     """
     A response is a Trigger and an Action, along with tools to enable/disable the response.
     Otherwise, it's functionally a container class for a Trigger Action pair.
     """
+
+    __slots__ = ("trigger", "action", "name", "enabled")
+
     def __init__(self, trigger: Trigger, action: Action, name):
         """
         Creates a new Response
@@ -29,7 +34,7 @@ class Response:
         """
         if not self.enabled:
             return False
-        return await self.trigger.check(msg)
+        return await self.trigger.evaluate(msg)
 
     async def apply(self, msg, bot):
         """
@@ -40,6 +45,13 @@ class Response:
         """
         await self.action.apply(msg, bot)
 
+    def required_intents(self) -> Set[str]:
+        """
+        Gives the gateway intents this Response needs to work, by their names in discord.Intents.
+        :return: The names of the intents.
+        """
+        return self.trigger.required_intents() | self.action.required_intents()
+
     def get_state(self):
         """
         Returns the current state of this Response.
@@ -65,12 +77,15 @@ class SendOrReactResponse(Response):
     A Response superclass that allows for on the fly configuration between two actions: a ReactAction and a
     LiteralSendAction
     """
-    def __init__(self, trigger: Trigger, message: str, emoji_id: int, name, default="message"):
+
+    __slots__ = ("message", "emoji_id", "send_message_action", "react_action", "state")
+
+    def __init__(self, trigger: Trigger, message: str, emoji_id: Union[int, str], name, default="message"):
         """
         Create a new SendOrReactResponse
         :param trigger: The trigger for this Response
         :param message: The message for the LiteralSendAction
-        :param emoji_id: The emoji for the ReactAction
+        :param emoji_id: The emoji for the ReactAction, either a server emoji's id or a unicode emoji
         :param name: A unique name for the Response.
         Note that names are not case-sensitive and uniqueness is not checked for
         :param default: The default state of this Response.
@@ -105,12 +120,19 @@ class SendOrReactResponse(Response):
 
         self.state = state
 
+    def required_intents(self) -> Set[str]:
+        # either action could be switched to at any time
+        return (self.trigger.required_intents() | self.send_message_action.required_intents()
+                | self.react_action.required_intents())
+
 class RandomChanceResponse(Response):
     """
     A response that has a random chance to apply it's action when triggered.
     The chance of the randomness is configurable on the fly.
     """
 
+    __slots__ = ("chance",)
+
     def __init__(self, trigger: Trigger, action: Action, name, default=0.5):
         super().__init__(trigger, action, name)
 
@@ -141,6 +163,6 @@ class RandomChanceResponse(Response):
         :return: Nothing
         """
 
-        if random.random() < self.chance:
+        if selection.stream("chances").random() < self.chance:
             await super().apply(msg, bot)
 
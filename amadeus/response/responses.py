@@ -1,4 +1,4 @@
-from typing import Dict, Optional
+from typing import Dict, Optional, Set
 
 from .response import *
 from .actions import *
@@ -84,6 +84,14 @@ def set_all_enabled(states: Dict[str, bool]):
             pass
 
 
+def required_intents() -> Set[str]:
+    """
+    Gives the gateway intents needed by all responses, by their names in discord.Intents.
+    :return: The names of the intents.
+    """
+    return set().union(*(x.required_intents() for x in responses))
+
+
 def get_response_by_name(name: str) -> Optional[Response]:
     """
     Returns the given response with the given name, or None if the given Response doesn't exist.
@@ -144,8 +152,9 @@ cool_bot = SendOrReactResponse(
 )
 
 dad_bot = RandomChanceResponse(
-    RegexTrigger(r"^.*( |^)i['‘ʼ’]?m (.+)"),
-    RegexSendAction(r"^.*( |^)i['‘ʼ’]?m (.+)", r"Hi \2, I'm dad!"),
+    RegexTrigger(r"^.*( |^)i'?m (.+)"),
+    # the reply is built from the content as written, so curly apostrophes have to be matched here too
+    RegexSendAction(r"^.*( |^)i['’ʼ]?m (.+)", r"Hi \2, I'm dad!"),
     "Dad Bot"
 )
 
@@ -0,0 +1,116 @@
+"""
+Random selection for the actions and responses.
+
+Weighted choices are drawn in constant time from an alias table (Vose's method), built once when the
+responses are loaded. Every draw comes from a named random stream, so seeding the streams (see seed_streams)
+makes a replay pick exactly what it picked the last time.
+"""
+import random
+from typing import Dict, Generic, Optional, Sequence, Tuple, TypeVar
+
+T = TypeVar("T")
+
+_streams: Dict[str, random.Random] = {}
+_seed = None
+
+
+def stream(name: str) -> random.Random:
+    """
+    Gets a named random stream, creating it if needed.
+    :param name: The name of the stream.
+    :return: The stream.
+    """
+    rng = _streams.get(name)
+
+    if rng is None:
+        rng = _streams[name] = random.Random(None if _seed is None else f"{_seed}:{name}")
+
+    return rng
+
+
+def seed_streams(seed):
+    """
+    Seeds every random stream, including ones created later.
+    Each stream gets its own seed derived from this one and its name,
+    so draws from one stream don't change what another one picks.
+    :param seed: The seed. None seeds them from the system instead.
+    :return: Nothing
+    """
+    global _seed
+
+    _seed = seed
+
+    for name, rng in _streams.items():
+        rng.seed(None if seed is None else f"{seed}:{name}")
+
+
+class AliasTable(Generic[T]):
+    """
+    A list of items to pick from at random, with optional weights, where every pick takes constant time.
+    """
+
+    __slots__ = ("items", "probability", "alias")
+
+    def __init__(self, items: Sequence[T], weights: Optional[Sequence[float]] = None):
+        """
+        Creates a new AliasTable
+        :param items: The items to pick from.
+        :param weights: How likely each item is to be picked, relative to the others. Defaults to all the same.
+        """
+        if len(items) == 0:
+            raise ValueError("there must be at least one item to pick from")
+
+        self.items: Tuple[T, ...] = tuple(items)
+
+        if weights is not None:
+            if len(weights) != len(items):
+                raise ValueError("there must be one weight per item")
+
+            if any(w < 0 for w in weights) or sum(weights) <= 0:
+                raise ValueError("weights can't be negative, and at least one must be positive")
+
+        if weights is None or len(set(weights)) == 1:
+            # all equally likely, so a plain index is enough
+            self.probability = None
+            self.alias = None
+            return
+
+        n = len(weights)
+        total = sum(weights)
+        scaled = [w * n / total for w in weights]
+
+        probability = [1.0] * n
+        alias = list(range(n))
+
+        small = [i for i, p in enumerate(scaled) if p < 1]
+        large = [i for i, p in enumerate(scaled) if p >= 1]
+
+        while small and large:
+            s = small.pop()
+            l = large.pop()
+
+            probability[s] = scaled[s]
+            alias[s] = l
+
+            scaled[l] -= 1 - scaled[s]
+            (small if scaled[l] < 1 else large).append(l)
+
+        # anything left over is only off from 1 by rounding error
+        self.probability = tuple(probability)
+        self.alias = tuple(alias)
+
+    def __len__(self):
+        return len(self.items)
+
+    def pick(self, rng: random.Random) -> T:
+        """
+        Picks an item at random.
+        :param rng: The random stream to draw from.
+        :return: The item.
+        """
+        i = rng.randrange(len(self.items))
+
+        if self.probability is None or rng.random() < self.probability[i]:
+            return self.items[i]
+
+        return self.items[self.alias[i]]
@@ -1,10 +1,78 @@
+import inspect
 import re
-from typing import List
+import weakref
+from typing import List, Set
 
 import discord
 
+from . import offload, patterns
+from .message import NormalizedMessage, folded_content, normalize, normalized_content
 
-class Trigger:
+
+def _freeze(value):
+    # turns lists and dicts into something hashable, so they can be part of an interning key
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(x) for x in value)
+    if isinstance(value, dict):
+        return frozenset((k, _freeze(v)) for k, v in value.items())
+    return value
+
+
+class _InterningMeta(type):
+    """
+    Hash-conses triggers: creating a trigger with the same type and arguments as one that already exists
+    gives back the existing one instead of a copy. As the arguments of a composite trigger are
+    triggers themselves, this means structurally identical subtrees are only ever stored once,
+    and two triggers are structurally identical exactly when they are the same object.
+
+    Triggers with per-instance state set shareable to False, and are always created fresh.
+    Once created, a shareable trigger is sealed, so sharing it can't leak changes between its users.
+    """
+
+    def __init__(cls, name, bases, namespace):
+        super().__init__(name, bases, namespace)
+        cls._interned = weakref.WeakValueDictionary()
+        cls._signature = inspect.signature(cls.__init__)
+
+    def __call__(cls, *args, **kwargs):
+        if not cls.shareable:
+            return super().__call__(*args, **kwargs)
+
+        bound = cls._signature.bind(None, *args, **kwargs)
+        bound.apply_defaults()
+
+        try:
+            key = _freeze(list(bound.arguments.values())[1:])
+            hash(key)
+        except TypeError:
+            # something in the arguments can't be compared, so there's no way to tell if it's a duplicate
+            return super().__call__(*args, **kwargs)
+
+        trigger = cls._interned.get(key)
+
+        if trigger is None:
+            trigger = super().__call__(*args, **kwargs)
+            object.__setattr__(trigger, "_sealed", True)
+            cls._interned[key] = trigger
+
+        return trigger
+
+
+class Trigger(metaclass=_InterningMeta):
+    """
+    The base class of all triggers.
+    Triggers are slotted, and shareable ones are hash-consed and immutable once created (see _InterningMeta).
+    """
+
+    __slots__ = ("_sealed", "__weakref__")
+
+    # whether identical triggers can be the same object, i.e. whether the trigger has no per-instance state
+    shareable = True
+
+    def __setattr__(self, name, value):
+        if getattr(self, "_sealed", False):
+            raise AttributeError(f"{type(self).__name__} is shared between responses, so it can't be changed")
+        super().__setattr__(name, value)
 
     async def check(self, msg: discord.Message) -> bool:
         """
@@ -15,12 +83,48 @@ class Trigger:
 
         raise NotImplemented
 
+    async def evaluate(self, msg: discord.Message) -> bool:
+        """
+        Checks the trigger, reusing the result if this trigger has already been checked against this message.
+        Shareable triggers are hash-consed, so the same subtree in different responses is the same trigger,
+        and gets checked at most once per message.
+        Results are only kept on a NormalizedMessage; for a plain message this is the same as check.
+        :param msg: The message that is being responded to
+        :return: Whether the attached action should be executed or not
+        """
+        results = getattr(msg, "trigger_results", None)
+
+        # unshareable triggers have state, so they have to see every check
+        if results is None or not self.shareable:
+            return await self.check(msg)
+
+        try:
+            return results[self]
+        except KeyError:
+            pass
+
+        result = results[self] = await self.check(msg)
+        return result
+
+    def required_intents(self) -> Set[str]:
+        """
+        Gives the gateway intents this trigger needs to work, by their names in discord.Intents.
+        By default a trigger is assumed to read the content of messages.
+        :return: The names of the intents.
+        """
+        return {"guild_messages", "dm_messages", "message_content"}
+
 class ChannelCooldownTrigger(Trigger):
     """
     A trigger that will call it's nested trigger after it's check has been called a certain number of times within the channel. 
     The cooldown will start after the 
     """
 
+    __slots__ = ("needed", "cooldowns", "trigger")
+
+    # the cooldowns are per instance
+    shareable = False
+
     def __init__(self, needed: int, trigger: Trigger) -> None:
         self.needed = needed
         self.cooldowns = {}
@@ -34,7 +138,7 @@ class ChannelCooldownTrigger(Trigger):
         # else if it's over
         else:
 
-            if await self.trigger.check(msg):
+            if await self.trigger.evaluate(msg):
                 # then start cooldown
                 self.cooldowns[msg.channel] = self.needed
                 return True
@@ -45,6 +149,9 @@ class ChannelCooldownTrigger(Trigger):
 
             return False
 
+    def required_intents(self) -> Set[str]:
+        return self.trigger.required_intents()
+
 
 
 
@@ -58,26 +165,30 @@ class LiteralsTrigger(Trigger):
     Does not set a result.
     """
 
+    __slots__ = ("phrases", "contains", "case_sensitive")
+
     def __init__(self, phrases: List[str], contains=False, case_sensitive=True):
         """
         Creates a new LiteralsTrigger
         :param phrases: a list of phrases that will trip the trigger
         :param contains: whether it has to be an exact match, or if the message nearly has to contain a phrase
         :param case_sensitive: whether it has to match case exactly with the specified phrase.
+        If not, both the phrases and the message are compared in their normalized form (see message.normalize).
         """
-        self.phrases = phrases
         self.contains = contains
         self.case_sensitive = case_sensitive
 
-        if not case_sensitive:
-            self.phrases = [x.lower() for x in phrases]
+        if case_sensitive:
+            self.phrases = tuple(phrases)
+        else:
+            self.phrases = tuple(normalize(x) for x in phrases)
 
     async def check(self, msg: discord.Message) -> bool:
 
-        content = msg.content
-
-        if not self.case_sensitive:
-            content = content.lower()
+        if self.case_sensitive:
+            content = msg.content
+        else:
+            content = normalized_content(msg)
 
         for phrase in self.phrases:
             if (not self.contains and phrase == content) or phrase in content:
@@ -88,8 +199,15 @@ class LiteralsTrigger(Trigger):
 class RegexTrigger(Trigger):
     """
     A trigger that trips when a message matches a regex.
+    The regex is matched against the folded content of the message (see message.fold), so it only has to match
+    plain quotes, and leaves case to its flags.
+    The regex is simplified and checked for slow constructs when the trigger is created (see patterns.prepare_search).
+    It's matched with RE2 if the linear engine is enabled and RE2 supports it, and otherwise long messages are
+    matched in a worker process if offloading is enabled (see offload.enable_offloading).
     """
 
+    __slots__ = ("regex", "flags", "search_regex", "problems")
+
     def __init__(self, regex, flags=re.IGNORECASE | re.MULTILINE):
         """
         Creates a new RegexTrigger
@@ -98,15 +216,29 @@ class RegexTrigger(Trigger):
         """
         self.regex = regex
         self.flags = flags
+        self.search_regex, problems = patterns.prepare_search(regex, flags)
+        self.problems = tuple(problems)
 
     async def check(self, msg: discord.Message) -> bool:
-        return re.search(self.regex, msg.content, flags=self.flags) is not None
+        content = folded_content(msg)
+
+        if patterns.use_linear_engine:
+            compiled = patterns.compile_linear(self.search_regex, self.flags)
+            if compiled is not None:
+                return compiled.search(content) is not None
+
+        if offload.offloader is not None:
+            return await offload.offloader.search(self.search_regex, self.flags, content)
+        return re.search(self.search_regex, content, flags=self.flags) is not None
 
 
 class LastAuthorTrigger(Trigger):
     """
     A trigger that trips when the previous message sent was sent by a certain user.
     """
+
+    __slots__ = ("author",)
+
     def __init__(self, author: int):
         """
         Creates a new LastAuthorTrigger
@@ -123,11 +255,18 @@ class LastAuthorTrigger(Trigger):
 
         return False if last_message is None else last_message.author.id == self.author
 
+    def required_intents(self) -> Set[str]:
+        # the history is fetched over REST, so only the message event itself is needed
+        return {"guild_messages", "dm_messages"}
+
 
 class OrTrigger(Trigger):
     """
     A trigger that trips when any of the triggers given to it trips.
     """
+
+    __slots__ = ("triggers",)
+
     def __init__(self, *args: Trigger):
         """
         Creates a new OrTrigger
@@ -137,16 +276,22 @@ class OrTrigger(Trigger):
 
     async def check(self, msg: discord.Message) -> bool:
         for i in self.triggers:
-            if await i.check(msg):
+            if await i.evaluate(msg):
                 return True
 
         return False
 
+    def required_intents(self) -> Set[str]:
+        return set().union(*(i.required_intents() for i in self.triggers))
+
 
 class AndTrigger(Trigger):
     """
     A trigger that trips when all the triggers given to it trips.
     """
+
+    __slots__ = ("triggers",)
+
     def __init__(self, *args: Trigger):
         """
         Creates a new AndTrigger
@@ -156,16 +301,22 @@ class AndTrigger(Trigger):
 
     async def check(self, msg: discord.Message) -> bool:
         for i in self.triggers:
-            if not await i.check(msg):
+            if not await i.evaluate(msg):
                 return False
 
         return True
 
+    def required_intents(self) -> Set[str]:
+        return set().union(*(i.required_intents() for i in self.triggers))
+
 
 class MentionsTrigger(Trigger):
     """
     A trigger that trips when specified user is mentioned, or optionally if the message is replying to a message by the user.
     """
+
+    __slots__ = ("ping_id", "reply")
+
     def __init__(self, ping_id: int, reply=True):
         """
         Creates a new MentionsTrigger
@@ -179,3 +330,7 @@ class MentionsTrigger(Trigger):
         if self.reply:
             return self.ping_id in msg.raw_mentions or (msg.reference is not None and type(msg.reference.resolved) is not discord.DeletedReferencedMessage and msg.reference.resolved.author.id == self.ping_id)
         return self.ping_id in msg.raw_mentions
+
+    def required_intents(self) -> Set[str]:
+        # mentions and replies are sent without the message content intent
+        return {"guild_messages", "dm_messages"}
@@ -0,0 +1,99 @@
+import bisect
+import difflib
+import hashlib
+import os
+import sys
+from typing import List, Optional, Tuple
+
+
+class StandNames:
+    """
+    The list of stand names, loaded from a file with one name per line.
+
+    Names are interned and kept in a tuple, with a sorted casefolded copy for prefix lookups.
+    The file is reloaded whenever it changes on disk, the next time a name is asked for.
+    """
+
+    def __init__(self, path: str):
+        """
+        Creates a new StandNames. The file isn't read until a name is needed.
+        :param path: The path of the file.
+        """
+        self.path = path
+        self.names: Tuple[str, ...] = ()
+        self._folded: List[str] = []
+        self._sorted: List[Tuple[str, int]] = []
+        self._mtime_ns = None
+
+    def _reload_if_changed(self):
+        try:
+            mtime_ns = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            mtime_ns = None
+
+        if mtime_ns == self._mtime_ns:
+            return
+
+        self._mtime_ns = mtime_ns
+
+        if mtime_ns is None:
+            names = []
+        else:
+            with open(self.path, encoding="utf8") as f:
+                names = [sys.intern(line.strip()) for line in f if line.strip()]
+
+        self.names = tuple(names)
+        self._folded = [x.casefold() for x in names]
+        self._sorted = sorted((x, i) for i, x in enumerate(self._folded))
+
+    def __len__(self):
+        self._reload_if_changed()
+        return len(self.names)
+
+    def assign(self, user_id: int) -> Optional[str]:
+        """
+        Gives the stand for a user. The same user always gets the same stand, as long as the list doesn't change.
+        :param user_id: The id of the user.
+        :return: The stand name, or None if there are no stands.
+        """
+        self._reload_if_changed()
+
+        if not self.names:
+            return None
+
+        md5 = hashlib.md5(str(user_id).encode("utf8")).digest()
+        return self.names[int.from_bytes(md5[:8], "big") % len(self.names)]
+
+    def search(self, query: str, limit=25) -> List[str]:
+        """
+        Finds stand names matching a query.
+        Names starting with the query come first, then names containing it, then names that are merely close to it.
+        :param query: What to search for. Case doesn't matter.
+        :param limit: The most names to return.
+        :return: The matching names.
+        """
+        self._reload_if_changed()
+
+        query = query.casefold()
+
+        if not query:
+            return list(self.names[:limit])
+
+        found = []
+
+        start = bisect.bisect_left(self._sorted, (query, -1))
+        for folded, i in self._sorted[start:]:
+            if not folded.startswith(query) or len(found) >= limit:
+                break
+            found.append(i)
+
+        if len(found) < limit:
+            seen = set(found)
+            found.extend(i for i, x in enumerate(self._folded) if query in x and i not in seen)
+
+        if len(found) < limit:
+            seen = set(found)
+            close = difflib.get_close_matches(query, self._folded, n=limit, cutoff=0.6)
+            found.extend(i for i in (self._folded.index(x) for x in close) if i not in seen)
+
+        return [self.names[i] for i in found[:limit]]
@@ -0,0 +1,295 @@
+"""
+The on-disk snapshot format for the bot's state.
+
+A snapshot is a small header followed by a sequence of sections:
+
+    header:  b"AMDS" | version (uint16, big endian)
+    section: length (uint32, big endian) | kind (uint8) | name length (uint8) | utf8 name | payload
+
+The payload of a JSON section (kind 0) is utf8 json. The payload of a table section (kind 1) is a table of
+integers, n int64 keys followed by n int64 values, little endian, for big tables like click_db where decoding
+json would be slow. Version 1 snapshots had no kind or name, just the utf8 json of [name, data].
+
+Every section is length-prefixed, so a section that fails to decode or validate can be skipped
+without losing the sections after it. Nothing in here executes code from the file, unlike pickle.
+"""
+import json
+import logging
+import os
+import pickle
+import struct
+import sys
+from array import array
+from typing import Any, BinaryIO, Callable, Dict, Iterator, Tuple
+
+log = logging.getLogger(__name__)
+
+
+MAGIC = b"AMDS"
+VERSION = 2
+
+JSON_SECTION = 0
+TABLE_SECTION = 1
+
+# sections that are saved as tables of integers rather than as json
+TABLES = {"click_db"}
+
+_HEADER = struct.Struct(">4sH")
+_LENGTH = struct.Struct(">I")
+_SECTION = struct.Struct(">BB")
+
+
+class StateError(Exception):
+    """
+    Raised when a snapshot can't be read at all, e.g. a bad header or an unknown version.
+    """
+    pass
+
+
+def _str_map(value_type: type) -> Callable[[Any], Dict[str, Any]]:
+    def validate(data):
+        if not isinstance(data, dict):
+            raise StateError(f"expected an object, not {type(data).__name__}")
+        for k, v in data.items():
+            if not isinstance(v, value_type):
+                raise StateError(f"value for {k} should be a {value_type.__name__}, not {type(v).__name__}")
+        return data
+    return validate
+
+
+def _int_map(data) -> Dict[int, int]:
+    if not isinstance(data, dict):
+        raise StateError(f"expected a table, not {type(data).__name__}")
+    # json object keys are always strings, so int keys mean it came from a table section, which can only hold ints.
+    # this saves checking every entry of a big table again
+    if data and type(next(iter(data))) is not int:
+        raise StateError("expected a table of integers, not an object")
+    return data
+
+
+# section name -> function that validates the decoded data and returns the value to use
+SCHEMA: Dict[str, Callable[[Any], Any]] = {
+    "responses_states": _str_map(str),
+    "responses_enabled": _str_map(bool),
+    "click_db": _int_map,
+}
+
+
+def _migrate_1(sections: Dict[str, Any]) -> Dict[str, Any]:
+    # version 1 kept click_db as a json object, so member ids were strings
+    if "click_db" in sections:
+        try:
+            sections["click_db"] = {int(k): v for k, v in _str_map(int)(sections["click_db"]).items()}
+        except (ValueError, StateError) as e:
+            log.warning("Skipping invalid section click_db: %s", e)
+            del sections["click_db"]
+
+    return sections
+
+
+# version -> function taking the sections of that version and returning the sections of the next one
+MIGRATIONS: Dict[int, Callable[[Dict[str, Any]], Dict[str, Any]]] = {
+    1: _migrate_1,
+}
+
+
+def read_header(f: BinaryIO) -> int:
+    """
+    Reads and checks the header of a snapshot.
+    :param f: A binary file positioned at the start of the snapshot.
+    :return: The version of the snapshot.
+    """
+    header = f.read(_HEADER.size)
+
+    if len(header) < _HEADER.size:
+        raise StateError("snapshot is too short to have a header")
+
+    magic, version = _HEADER.unpack(header)
+
+    if magic != MAGIC:
+        raise StateError("snapshot has the wrong magic bytes")
+
+    if version > VERSION:
+        raise StateError(f"snapshot version {version} is newer than supported version {VERSION}")
+
+    if version < 1:
+        raise StateError(f"snapshot version {version} is not a valid version")
+
+    return version
+
+
+def _decode_table(payload: memoryview) -> Dict[int, int]:
+    if len(payload) % 16:
+        raise ValueError(f"table is {len(payload)} bytes, which isn't a whole number of entries")
+
+    # memoryview.cast only does native byte order
+    if sys.byteorder == "little":
+        ints = payload.cast("q")
+    else:
+        ints = array("q", payload)
+        ints.byteswap()
+
+    half = len(ints) // 2
+    return dict(zip(ints[:half].tolist(), ints[half:].tolist()))
+
+
+def _encode_table(data: Dict[int, int]) -> bytes:
+    ints = array("q", data.keys())
+    ints.extend(data.values())
+
+    if sys.byteorder != "little":
+        ints.byteswap()
+
+    return ints.tobytes()
+
+
+def _decode_section(payload: bytes, version: int) -> Tuple[Any, Any]:
+    if version == 1:
+        name, data = json.loads(payload)
+        return name, data
+
+    kind, name_length = _SECTION.unpack_from(payload)
+    start = _SECTION.size + name_length
+    name = payload[_SECTION.size:start].decode("utf8")
+
+    if kind == JSON_SECTION:
+        return name, json.loads(payload[start:])
+    if kind == TABLE_SECTION:
+        # a view, so the table isn't copied again before it's decoded
+        return name, _decode_table(memoryview(payload)[start:])
+
+    raise ValueError(f"unknown section kind {kind}")
+
+
+def iter_sections(f: BinaryIO, version: int = VERSION) -> Iterator[Tuple[str, Any]]:
+    """
+    Reads a snapshot one section at a time.
+    Sections that are corrupt are reported and skipped; a truncated section ends the stream.
+    :param f: A binary file positioned just after the header of the snapshot.
+    :param version: The version of the snapshot, from read_header.
+    :return: An iterator of (section name, raw section data)
+    """
+    while True:
+        prefix = f.read(_LENGTH.size)
+
+        if not prefix:
+            return
+
+        if len(prefix) < _LENGTH.size:
+            log.warning("Snapshot ends in a truncated section, ignoring it")
+            return
+
+        (length,) = _LENGTH.unpack(prefix)
+        payload = f.read(length)
+
+        if len(payload) < length:
+            log.warning("Snapshot ends in a truncated section, ignoring it")
+            return
+
+        try:
+            name, data = _decode_section(payload, version)
+        except (ValueError, TypeError, struct.error) as e:
+            log.warning("Skipping corrupt section: %s", e)
+            continue
+
+        if not isinstance(name, str):
+            log.warning("Skipping section with a %s for a name", type(name).__name__)
+            continue
+
+        yield name, data
+
+
+def _validate(name: str, data: Any, out: Dict[str, Any]):
+    if name not in SCHEMA:
+        log.warning("Skipping unknown section %s", name)
+        return
+
+    try:
+        out[name] = SCHEMA[name](data)
+    except StateError as e:
+        log.warning("Skipping invalid section %s: %s", name, e)
+
+
+def load(path: str) -> Dict[str, Any]:
+    """
+    Loads a snapshot, migrating it to the current version and validating every section.
+    Sections that are corrupt, unknown, or fail validation are left out of the result.
+    :param path: The path of the snapshot.
+    :return: A dictionary of the form {section name: section value}
+    """
+    out = {}
+
+    with open(path, "rb") as f:
+        version = read_header(f)
+
+        if version == VERSION:
+            # nothing to migrate, so each section can be validated as it's read
+            for name, data in iter_sections(f, version):
+                _validate(name, data, out)
+
+            return out
+
+        sections = dict(iter_sections(f, version))
+
+    while version < VERSION:
+        if version not in MIGRATIONS:
+            raise StateError(f"no migration from snapshot version {version}")
+
+        sections = MIGRATIONS[version](sections)
+        version += 1
+
+    for name, data in sections.items():
+        _validate(name, data, out)
+
+    return out
+
+
+def save(path: str, sections: Dict[str, Any]):
+    """
+    Saves a snapshot.
+    The snapshot is written to a temporary file first and then moved into place,
+    so a crash halfway through never leaves a half written snapshot behind.
+    :param path: The path of the snapshot.
+    :param sections: A dictionary of the form {section name: section value}
+    :return: Nothing
+    """
+    tmp_path = path + ".tmp"
+
+    with open(tmp_path, "wb") as f:
+        f.write(_HEADER.pack(MAGIC, VERSION))
+
+        for name, data in sections.items():
+            encoded_name = name.encode("utf8")
+
+            if name in TABLES:
+                kind, payload = TABLE_SECTION, _encode_table(data)
+            else:
+                kind, payload = JSON_SECTION, json.dumps(data, separators=(",", ":")).encode("utf8")
+
+            f.write(_LENGTH.pack(_SECTION.size + len(encoded_name) + len(payload)))
+            f.write(_SECTION.pack(kind, len(encoded_name)))
+            f.write(encoded_name)
+            f.write(payload)
+
+    os.replace(tmp_path, path)
+
+
+def load_legacy_pickle(path: str) -> Dict[str, Any]:
+    """
+    Loads the state from the pickle used before snapshots existed.
+    This is only meant for moving an old data.pickle over once, as unpickling can run arbitrary code.
+    :param path: The path of the pickle.
+    :return: A dictionary of the form {section name: section value}
+    """
+    with open(path, "rb") as f:
+        save = pickle.Unpickler(f).load()
+
+    out = {}
+
+    for name, validate in SCHEMA.items():
+        try:
+            out[name] = validate(dict(save[name]))
+        except (KeyError, TypeError, ValueError, StateError) as e:
+            log.warning("Skipping legacy section %s: %s", name, e)
+
+    return out
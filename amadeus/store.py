@@ -0,0 +1,158 @@
+import sqlite3
+from typing import Any, Dict
+
+
+class SharedStore:
+    """
+    State shared between several Amadeus processes running different shards.
+
+    This is an sqlite database in WAL mode, so any number of processes can read it while one writes,
+    and writers wait their turn, briefly, rather than failing straight away. Click counts are incremented in place, so
+    increments from different processes never overwrite each other.
+    Response states and toggles carry a version number, which lets each process notice when another
+    one has changed them. Each process only writes the states and toggles it has changed itself,
+    so it never overwrites another process's changes to anything else.
+
+    Every call runs on the caller's thread, which is the event loop, so the wait for another process's write
+    is kept short. A call that can't get the database in time raises sqlite3.OperationalError, which callers
+    should treat as "try again later".
+    """
+
+    def __init__(self, path: str, timeout=0.25, setup_timeout=10.0):
+        """
+        Creates a new SharedStore, creating the database if it doesn't exist yet.
+        :param path: The path of the database.
+        :param timeout: How long, in seconds, to wait for another process's write to finish.
+        :param setup_timeout: How long, in seconds, to wait while creating the database. This happens before the
+        event loop starts, and all the processes tend to start at once, so it can wait longer.
+        """
+        self.path = path
+        self.connection = sqlite3.connect(path, timeout=setup_timeout, isolation_level=None)
+
+        # the response states and toggles as this process last read or wrote them, to tell what it has changed
+        self._known_states: Dict[str, str] = {}
+        self._known_enabled: Dict[str, bool] = {}
+
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+
+        self.connection.executescript("""
+            CREATE TABLE IF NOT EXISTS clicks (member_id INTEGER PRIMARY KEY, count INTEGER NOT NULL);
+            CREATE TABLE IF NOT EXISTS responses (name TEXT PRIMARY KEY, state TEXT, enabled INTEGER);
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL);
+        """)
+
+        self.connection.execute(f"PRAGMA busy_timeout = {int(timeout * 1000)}")
+
+    def close(self):
+        """
+        Closes the database.
+        :return: Nothing
+        """
+        self.connection.close()
+
+    def increment_click(self, member_id: int) -> int:
+        """
+        Adds one to a member's click count.
+        :param member_id: The id of the member.
+        :return: The new click count.
+        """
+        with self.connection:
+            self.connection.execute("BEGIN IMMEDIATE")
+            self.connection.execute(
+                "INSERT INTO clicks VALUES (?, 1) ON CONFLICT(member_id) DO UPDATE SET count = count + 1",
+                (member_id,)
+            )
+            (count,) = self.connection.execute("SELECT count FROM clicks WHERE member_id = ?", (member_id,)).fetchone()
+
+        return count
+
+    def click_db(self) -> Dict[int, int]:
+        """
+        :return: All click counts, in the form {member id: count}
+        """
+        return dict(self.connection.execute("SELECT member_id, count FROM clicks"))
+
+    def responses_version(self) -> int:
+        """
+        :return: A number that goes up every time the response states or toggles are saved.
+        """
+        row = self.connection.execute("SELECT value FROM meta WHERE key = 'responses_version'").fetchone()
+        return 0 if row is None else row[0]
+
+    def load_responses(self) -> Dict[str, Dict[str, Any]]:
+        """
+        :return: The response states and toggles, in the same sections a state snapshot uses.
+        """
+        rows = self.connection.execute("SELECT name, state, enabled FROM responses").fetchall()
+
+        self._known_states = {name: s for name, s, _ in rows if s is not None}
+        self._known_enabled = {name: bool(e) for name, _, e in rows if e is not None}
+
+        return {
+            "responses_states": dict(self._known_states),
+            "responses_enabled": dict(self._known_enabled),
+        }
+
+    def save_responses(self, states: Dict[str, str], enabled: Dict[str, bool]) -> bool:
+        """
+        Saves the response states and toggles that have changed since this process last loaded or saved them.
+        Everything else is left alone, so changes other processes have made in the meantime are kept.
+        :param states: A dictionary of the form {response name: response state}
+        :param enabled: A dictionary of the form {response name: response enabled?}
+        :return: Whether anything was saved.
+        """
+        changed_states = [(k, v) for k, v in states.items() if self._known_states.get(k) != v]
+        changed_enabled = [(k, v) for k, v in enabled.items() if self._known_enabled.get(k) != v]
+
+        if not changed_states and not changed_enabled:
+            return False
+
+        with self.connection:
+            self.connection.execute("BEGIN IMMEDIATE")
+            self.connection.executemany(
+                "INSERT INTO responses (name, state) VALUES (?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET state = excluded.state",
+                changed_states
+            )
+            self.connection.executemany(
+                "INSERT INTO responses (name, enabled) VALUES (?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET enabled = excluded.enabled",
+                changed_enabled
+            )
+            self.connection.execute(
+                "INSERT INTO meta VALUES ('responses_version', 1) "
+                "ON CONFLICT(key) DO UPDATE SET value = value + 1"
+            )
+
+        self._known_states.update(changed_states)
+        self._known_enabled.update(changed_enabled)
+        return True
+
+    def seed(self, sections: Dict[str, Any]) -> bool:
+        """
+        Fills an empty store from a state snapshot. Does nothing if anything has been stored already,
+        so when several processes start at once only the first one seeds it.
+        :param sections: The sections of a state snapshot, as returned by state.load.
+        :return: Whether the store was seeded.
+        """
+        with self.connection:
+            self.connection.execute("BEGIN IMMEDIATE")
+
+            if self.connection.execute(
+                "SELECT EXISTS (SELECT 1 FROM clicks) OR EXISTS (SELECT 1 FROM responses)"
+            ).fetchone()[0]:
+                return False
+
+            self.connection.executemany(
+                "INSERT INTO clicks VALUES (?, ?)", list(sections.get("click_db", {}).items())
+            )
+
+            states = sections.get("responses_states", {})
+            enabled = sections.get("responses_enabled", {})
+            self.connection.executemany(
+                "INSERT INTO responses VALUES (?, ?, ?)",
+                [(name, states.get(name), enabled.get(name)) for name in states.keys() | enabled.keys()]
+            )
+
+        return True
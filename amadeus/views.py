@@ -0,0 +1,50 @@
+from typing import List, Optional
+
+import discord
+
+
+class PageView(discord.ui.View):
+    """
+    Buttons to flip between pages of embeds, for output too long for one embed.
+    """
+
+    def __init__(self, pages: List[discord.Embed], timeout=180):
+        """
+        Creates a new PageView
+        :param pages: The embeds to flip between. The first one is the one sent with the view.
+        :param timeout: How long, in seconds, the buttons keep working after they were last used.
+        """
+        super().__init__(timeout=timeout)
+        self.pages = pages
+        self.page = 0
+        # the message the view is on, so the buttons can be taken off when it times out
+        self.message: Optional[discord.Message] = None
+
+        for i, embed in enumerate(pages):
+            embed.set_footer(text=f"page {i + 1}/{len(pages)}")
+
+        self._update_buttons()
+
+    def _update_buttons(self):
+        self.previous_page.disabled = self.page == 0
+        self.next_page.disabled = self.page == len(self.pages) - 1
+
+    async def _show(self, interaction: discord.Interaction, page: int):
+        self.page = page
+        self._update_buttons()
+        await interaction.response.edit_message(embed=self.pages[page], view=self)
+
+    @discord.ui.button(label="◀", style=discord.ButtonStyle.secondary)
+    async def previous_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await self._show(interaction, max(self.page - 1, 0))
+
+    @discord.ui.button(label="▶", style=discord.ButtonStyle.secondary)
+    async def next_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await self._show(interaction, min(self.page + 1, len(self.pages) - 1))
+
+    async def on_timeout(self):
+        if self.message is not None:
+            try:
+                await self.message.edit(view=None)
+            except discord.HTTPException:
+                pass
@@ -0,0 +1,128 @@
+import asyncio
+import logging
+import math
+import sys
+import threading
+import time
+import traceback
+from typing import Optional
+
+import discord
+
+from .metrics import Registry
+
+log = logging.getLogger(__name__)
+
+
+class Watchdog:
+    """
+    Keeps an eye on the event loop from a separate thread.
+
+    A task on the loop ticks every interval and records how late each tick was (the loop lag).
+    If the loop misses its tick by more than the threshold, the watchdog thread takes a sample of
+    the loop thread's stack and reports it along with the last command or response that was started,
+    as that's almost certainly what's blocking.
+    It also samples the gateway heartbeat latency for /ping.
+    Both the loop lag and the heartbeat latency are recorded as histograms in the metrics registry.
+    """
+
+    def __init__(self, client: discord.Client, metrics: Optional[Registry] = None, threshold=0.25, interval=0.05,
+                 heartbeat_interval=15):
+        """
+        Creates a new Watchdog
+        :param client: The client whose heartbeat latency should be tracked.
+        :param metrics: The registry to record the loop lag and heartbeat latency in. Defaults to a new one.
+        :param threshold: How long, in seconds, the loop can block before it gets reported.
+        :param interval: How often, in seconds, the loop ticks.
+        :param heartbeat_interval: How often, in seconds, the heartbeat latency is sampled.
+        """
+        self.client = client
+        self.threshold = threshold
+        self.interval = interval
+        self.heartbeat_interval = heartbeat_interval
+
+        self.activity = None
+        metrics = metrics if metrics is not None else Registry()
+        self.lag = metrics.histogram("amadeus_loop_lag_seconds", "How late the event loop's ticks were")
+        self.heartbeat = metrics.histogram("amadeus_heartbeat_latency_seconds", "The gateway heartbeat latency")
+
+        self._last_tick = time.monotonic()
+        self._loop_thread_id = None
+        self._tasks = []
+        self._thread = None
+        self._stopped = threading.Event()
+
+    def start(self):
+        """
+        Starts watching. This has to be called from within the event loop that should be watched.
+        :return: Nothing
+        """
+        loop = asyncio.get_running_loop()
+
+        self._loop_thread_id = threading.get_ident()
+        self._last_tick = time.monotonic()
+        self._stopped.clear()
+
+        self._tasks = [loop.create_task(self._tick()), loop.create_task(self._sample_heartbeat())]
+
+        self._thread = threading.Thread(target=self._watch, name="amadeus-watchdog", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stops watching.
+        :return: Nothing
+        """
+        self._stopped.set()
+
+        for task in self._tasks:
+            task.cancel()
+
+        self._tasks = []
+
+    def track(self, name: str):
+        """
+        Notes down the command or response that is about to run, so it can be blamed if the loop blocks.
+        :param name: The name of the command or response.
+        :return: Nothing
+        """
+        self.activity = name
+
+    async def _tick(self):
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+
+            now = time.monotonic()
+            self._last_tick = now
+            self.lag.observe(max(0.0, now - expected))
+
+    async def _sample_heartbeat(self):
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+
+            # latency is nan or inf until the first heartbeat is acknowledged
+            latency = self.client.latency
+            if math.isfinite(latency):
+                self.heartbeat.observe(latency)
+
+    def _watch(self):
+        blocked_since = None
+
+        while not self._stopped.wait(self.interval):
+            last_tick = self._last_tick
+            blocked = time.monotonic() - last_tick - self.interval
+
+            if blocked > self.threshold:
+                if blocked_since != last_tick:
+                    blocked_since = last_tick
+
+                    frame = sys._current_frames().get(self._loop_thread_id)
+                    stack = "".join(traceback.format_stack(frame)) if frame is not None else "(no stack)\n"
+
+                    log.warning("Event loop blocked for %.0fms, last started: %s\n%s", blocked * 1000, self.activity,
+                                stack.rstrip("\n"))
+
+            elif blocked_since is not None:
+                log.warning("Event loop unblocked after %.0fms", (time.monotonic() - blocked_since) * 1000)
+                blocked_since = None
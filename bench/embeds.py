@@ -0,0 +1,62 @@
+"""
+Times building each kind of embed, against interning it and against rendering it from a template dict
+with Embed.from_dict.
+
+    python -m bench.embeds [--number 50000]
+"""
+import argparse
+import timeit
+
+import discord
+
+from amadeus import embeds
+
+
+def from_template(template, **fields):
+    return discord.Embed.from_dict(dict(template, **fields))
+
+
+ERROR_TEMPLATE = {"type": "rich", "title": "Error", "color": embeds.ERROR_COLOR}
+DEFAULT_TEMPLATE = {"type": "rich"}
+DC_TEMPLATE = {"type": "rich", "title": "dc"}
+
+CASES = {
+    "error": [
+        ("built", lambda: embeds.error_embed("x")),
+        ("interned", lambda: embeds.interned(embeds.error_embed, "x")),
+        ("from_dict", lambda: from_template(ERROR_TEMPLATE, description="x")),
+    ],
+    "default": [
+        ("built", lambda: embeds.default_embed("Responses", "x")),
+        ("from_dict", lambda: from_template(DEFAULT_TEMPLATE, title="Responses", description="x",
+                                            color=embeds.DEFAULT_COLOR)),
+    ],
+    "action": [
+        ("built", lambda: embeds.action_embed("**a** hugs **b**")),
+        ("from_dict", lambda: from_template(DEFAULT_TEMPLATE, title="", description="**a** hugs **b**",
+                                            color=embeds.DEFAULT_COLOR)),
+    ],
+    "dc": [
+        ("built", lambda: embeds.dc_embed("3", "1 2 + p", "4")),
+        ("from_dict", lambda: from_template(DC_TEMPLATE, description="```3```", color=embeds.DEFAULT_COLOR, fields=[
+            {"name": "command", "value": "`1 2 + p`", "inline": True},
+            {"name": "stdin", "value": "`4`", "inline": True},
+        ])),
+    ],
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks building embeds")
+    parser.add_argument("--number", type=int, default=50000, help="How many embeds to build per timing")
+    parser.add_argument("--repeat", type=int, default=5, help="How many times to time each way")
+    args = parser.parse_args()
+
+    for kind, ways in CASES.items():
+        for way, function in ways:
+            best = min(timeit.repeat(function, number=args.number, repeat=args.repeat))
+            print(f"{kind:<10}{way:<12}{best / args.number * 1e6:>8.2f}us")
+
+
+if __name__ == '__main__':
+    main()
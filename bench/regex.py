@@ -0,0 +1,102 @@
+"""
+Times the response regexes against 4000-character messages (the most discord allows): as written,
+as simplified for re.search (see patterns.prepare_search), and with RE2 if google-re2 is installed.
+
+    python -m bench.regex [--length 4000]
+"""
+import argparse
+import random
+import re
+import timeit
+
+from amadeus import response
+from amadeus.response import patterns
+
+
+def find_regexes():
+    """
+    Finds every regex trigger and regex action in the responses.
+    :return: A list of (response name, kind, regex, flags, extra), where extra is the search regex of a trigger,
+    or the replacement of an action.
+    """
+    found = []
+
+    def walk(name, trigger):
+        if isinstance(trigger, response.RegexTrigger):
+            found.append((name, "trigger", trigger.regex, trigger.flags, trigger.search_regex))
+
+        for child in getattr(trigger, "triggers", ()):
+            walk(name, child)
+
+        if hasattr(trigger, "trigger"):
+            walk(name, trigger.trigger)
+
+    for r in response.responses:
+        walk(r.name, r.trigger)
+
+        if isinstance(r.action, response.RegexSendAction):
+            found.append((r.name, "action", r.action.regex, r.action.flags, r.action.replacement))
+
+    return found
+
+
+def messages(length):
+    rng = random.Random(0)
+    words = ["the", "bot", "is", "so", "cool", "amadeus", "hello", "what", "lol", "kurisu", "okabe", "i", "am"]
+    prose = []
+
+    while sum(len(x) + 1 for x in prose) < length:
+        prose.append(rng.choice(words))
+
+    return {
+        "prose": " ".join(prose)[:length],
+        "i i i": ("i " * length)[:length],
+        "mrmrmr": ("mr" * length)[:length],
+        "lines": ("i\n" * length)[:length],
+        "aaaa": "a" * length,
+    }
+
+
+def time_one(function, budget=0.2):
+    number = 1
+
+    while True:
+        taken = timeit.timeit(function, number=number)
+        if taken >= budget or number >= 1 << 16:
+            return taken / number
+        number *= 4
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks the response regexes on long messages")
+    parser.add_argument("--length", type=int, default=4000, help="How long each message is")
+    args = parser.parse_args()
+
+    has_re2 = patterns.re2 is not None
+    print(f"re2 {'is' if has_re2 else 'is not'} installed\n")
+    print(f"{'response':<12}{'kind':<9}{'message':<10}{'re':>12}{'simplified':>12}{'re2':>12}")
+
+    for name, kind, regex, flags, extra in find_regexes():
+        # triggers are searched with their simplified regex, actions substitute with the regex as written
+        linear = patterns.compile_linear(extra if kind == "trigger" else regex, flags) if has_re2 else None
+
+        for message_name, message in messages(args.length).items():
+            if kind == "trigger":
+                timings = [
+                    time_one(lambda: re.search(regex, message, flags=flags)),
+                    time_one(lambda: re.search(extra, message, flags=flags)),
+                    time_one(lambda: linear.search(message)) if linear is not None else None,
+                ]
+            else:
+                timings = [
+                    time_one(lambda: re.sub(regex, extra, message, flags=flags)),
+                    None,
+                    time_one(lambda: linear.sub(extra, message)) if linear is not None else None,
+                ]
+
+            cells = "".join(f"{t * 1e6:>10.1f}us" if t is not None else f"{'-':>12}" for t in timings)
+            print(f"{name:<12}{kind:<9}{message_name:<10}{cells}")
+
+
+if __name__ == '__main__':
+    main()
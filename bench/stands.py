@@ -0,0 +1,74 @@
+"""
+Times looking up stand names: assigning one to a user, and searching by prefix, substring and fuzzy match,
+as autocomplete does on every keystroke.
+
+    python -m bench.stands [--path data/stand_names.txt] [--scale 1]
+"""
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from amadeus.stands import StandNames
+
+
+def percentile(ordered, p):
+    return ordered[max(0, round(p / 100 * len(ordered)) - 1)]
+
+
+def time_calls(function, arguments):
+    timings = []
+
+    for argument in arguments:
+        start = time.perf_counter()
+        function(argument)
+        timings.append(time.perf_counter() - start)
+
+    return sorted(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks stand name lookups")
+    parser.add_argument("--path", default="data/stand_names.txt", help="The stand name list")
+    parser.add_argument("--scale", type=int, default=1,
+                        help="How many copies of the list to search, to see how it grows")
+    parser.add_argument("--number", type=int, default=2000, help="How many lookups of each kind")
+    args = parser.parse_args()
+
+    with open(args.path, encoding="utf8") as f:
+        base = [line.strip() for line in f if line.strip()]
+
+    names = [x if i == 0 else f"{x} {i}" for i in range(args.scale) for x in base]
+    rng = random.Random(0)
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "stand_names.txt")
+
+        with open(path, "w", encoding="utf8") as f:
+            f.write("\n".join(names))
+
+        stands = StandNames(path)
+
+        start = time.perf_counter()
+        len(stands)
+        print(f"{len(names)} names, loaded in {(time.perf_counter() - start) * 1000:.2f}ms")
+
+        picks = [rng.choice(names) for _ in range(args.number)]
+        cases = {
+            "assign": (stands.assign, [rng.randrange(10 ** 17, 10 ** 18) for _ in range(args.number)]),
+            "empty": (stands.search, [""] * args.number),
+            "prefix": (stands.search, [x[:rng.randint(1, 4)] for x in picks]),
+            "substring": (stands.search, [x[len(x) // 2:len(x) // 2 + 3] for x in picks]),
+            "fuzzy": (stands.search, [x.lower().replace("a", "e", 1)[:-1] + "q" for x in picks]),
+        }
+
+        for name, (function, arguments) in cases.items():
+            timings = time_calls(function, arguments)
+            print(f"{name:<12}p50 {percentile(timings, 50) * 1e6:>9.1f}us  "
+                  f"p99 {percentile(timings, 99) * 1e6:>9.1f}us  mean {statistics.fmean(timings) * 1e6:>9.1f}us")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+"""
+Compares loading a snapshot with a large click table against loading the same state from a pickle.
+
+    python -m bench.state_load [--clicks 500000]
+"""
+import argparse
+import os
+import pickle
+import random
+import tempfile
+import timeit
+
+from amadeus import state
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks loading state snapshots against pickles")
+    parser.add_argument("--clicks", type=int, default=500000, help="How many members in the click table")
+    parser.add_argument("--repeat", type=int, default=5, help="How many times to time each load")
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    sections = {
+        "responses_states": {f"response {i}": "message" for i in range(50)},
+        "responses_enabled": {f"response {i}": True for i in range(50)},
+        "click_db": {rng.randrange(10 ** 17, 10 ** 18): rng.randrange(1, 1000) for _ in range(args.clicks)},
+    }
+
+    with tempfile.TemporaryDirectory() as directory:
+        snapshot_path = os.path.join(directory, "data.state")
+        pickle_path = os.path.join(directory, "data.pickle")
+
+        state.save(snapshot_path, sections)
+
+        with open(pickle_path, "wb") as f:
+            pickle.dump(sections, f)
+
+        assert state.load(snapshot_path) == sections
+
+        def load_pickle():
+            with open(pickle_path, "rb") as f:
+                return pickle.load(f)
+
+        for name, function, path in [("snapshot", lambda: state.load(snapshot_path), snapshot_path),
+                                     ("pickle", load_pickle, pickle_path)]:
+            best = min(timeit.repeat(function, number=1, repeat=args.repeat))
+            print(f"{name:<10}{best * 1000:>10.1f}ms{os.path.getsize(path) / 1024:>10.0f}KiB")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,146 @@
+"""
+Measures the memory the responses take per guild, as if every guild had its own copy of the configuration.
+Each guild gets a fresh run of responses.py, and the memory is traced with tracemalloc:
+
+- interned: as the responses are built now, with slotted nodes and identical triggers shared.
+- unshared: the same slotted nodes, with trigger interning turned off.
+- baseline: the response classes as they were at a git revision (by default the first commit),
+  before they were slotted or interned.
+
+    python -m bench.triggers_memory [--guilds 1000] [--baseline REV]
+"""
+import argparse
+import gc
+import importlib
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import tracemalloc
+import types
+
+from amadeus.response import triggers
+
+RESPONSE_PACKAGE = "amadeus/response"
+
+
+def build_guilds(package: str, guilds: int):
+    """
+    Runs a response package's responses.py once per guild.
+    :param package: The name of the response package, which must already be imported.
+    :param guilds: How many guilds.
+    :return: The bytes allocated per guild, and the module of every guild.
+    """
+    path = sys.modules[package + ".responses"].__file__
+
+    with open(path, encoding="utf8") as f:
+        code = compile(f.read(), path, "exec")
+
+    gc.collect()
+    tracemalloc.start()
+    modules = []
+
+    for i in range(guilds):
+        module = types.ModuleType(f"{package}.responses_{i}")
+        module.__package__ = package
+        exec(code, module.__dict__)
+        modules.append(module)
+
+    gc.collect()
+    used, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return used / guilds, modules
+
+
+def count_nodes(modules) -> int:
+    """
+    Counts the distinct trigger objects reachable from every guild's responses.
+    """
+    seen = set()
+
+    def walk(trigger):
+        if id(trigger) in seen:
+            return
+        seen.add(id(trigger))
+
+        for child in getattr(trigger, "triggers", ()):
+            walk(child)
+
+        if hasattr(trigger, "trigger"):
+            walk(trigger.trigger)
+
+    for module in modules:
+        for r in module.responses:
+            walk(r.trigger)
+
+    return len(seen)
+
+
+def load_baseline(revision: str, directory: str) -> str:
+    """
+    Writes out the response package as it was at a git revision, and imports it under another name.
+    :return: The name it was imported as.
+    """
+    files = subprocess.run(["git", "ls-tree", "--name-only", f"{revision}:{RESPONSE_PACKAGE}"],
+                           check=True, capture_output=True, text=True).stdout.split()
+
+    package_directory = os.path.join(directory, "baseline_response")
+    os.mkdir(package_directory)
+
+    for name in files:
+        if name.endswith(".py"):
+            source = subprocess.run(["git", "show", f"{revision}:{RESPONSE_PACKAGE}/{name}"],
+                                    check=True, capture_output=True).stdout
+
+            with open(os.path.join(package_directory, name), "wb") as f:
+                f.write(source)
+
+    sys.path.insert(0, directory)
+    importlib.import_module("baseline_response")
+    return "baseline_response"
+
+
+def report(name: str, per_guild: float, modules):
+    print(f"{name:<10}{per_guild / 1024:>10.1f}KiB per guild{count_nodes(modules):>10} trigger objects")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks the memory used by per-guild responses")
+    parser.add_argument("--guilds", type=int, default=1000, help="How many guilds to build responses for")
+    parser.add_argument("--baseline", default=None,
+                        help="The git revision to take the old response classes from. Defaults to the first commit.")
+    args = parser.parse_args()
+
+    # every unshared regex would report its problems again
+    logging.disable(logging.WARNING)
+
+    per_guild, modules = build_guilds("amadeus.response", args.guilds)
+    report("interned", per_guild, modules)
+    del modules
+
+    triggers.Trigger.shareable = False
+    try:
+        per_guild, modules = build_guilds("amadeus.response", args.guilds)
+    finally:
+        triggers.Trigger.shareable = True
+    report("unshared", per_guild, modules)
+    del modules
+
+    revision = args.baseline
+
+    try:
+        if revision is None:
+            revision = subprocess.run(["git", "rev-list", "--max-parents=0", "HEAD"],
+                                      check=True, capture_output=True, text=True).stdout.split()[0]
+
+        with tempfile.TemporaryDirectory() as directory:
+            per_guild, modules = build_guilds(load_baseline(revision, directory), args.guilds)
+            report("baseline", per_guild, modules)
+    except (OSError, subprocess.CalledProcessError) as e:
+        print(f"baseline  couldn't be loaded from git: {e}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,10 +1,91 @@
+import argparse
+import asyncio
 import json
+import multiprocessing
+import signal
 
 import amadeus
+from amadeus import logs
 
-with open('data/config.json') as json_data_file:
-    data = json.load(json_data_file)
-    token = data['discord']['token']
 
-client = amadeus.create_client()
-client.run(token)
+async def start(token, **options):
+    client = amadeus.create_client(**options)
+
+    # the client shuts itself down on SIGINT or SIGTERM (see Lifecycle), which ends start
+    async with client:
+        await client.start(token)
+
+
+def run(token, log_options, **options):
+    listener = logs.setup_logging(**log_options)
+
+    try:
+        asyncio.run(start(token, **options))
+    finally:
+        # write out whatever is still queued
+        listener.stop()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Runs Amadeus.")
+    parser.add_argument("--shards", type=int, default=None,
+                        help="The total number of shards. Without this, Amadeus runs unsharded.")
+    parser.add_argument("--processes", type=int, default=1,
+                        help="How many processes to spread the shards over. Needs --shards.")
+    parser.add_argument("--record", default=None,
+                        help="Record the messages and commands seen to this log, for python -m amadeus.replay.")
+    args = parser.parse_args()
+
+    if args.processes > 1 and args.shards is None:
+        parser.error("--processes needs --shards")
+
+    with open('data/config.json') as json_data_file:
+        data = json.load(json_data_file)
+        token = data['discord']['token']
+
+    options = {
+        "watchdog": data.get('amadeus', {}).get('watchdog', False),
+        "offload": data.get('amadeus', {}).get('offload', False),
+        "linear_regex": data.get('amadeus', {}).get('linear_regex', False),
+        "lean": data.get('amadeus', {}).get('lean', False),
+        "record": args.record,
+        "admission": data.get('amadeus', {}).get('admission', False),
+    }
+
+    # each process serves its own metrics, on the ports following this one
+    metrics_port = data.get('amadeus', {}).get('metrics_port', None)
+
+    log_options = data.get('logging', {})
+
+    if args.record is not None and args.processes > 1:
+        parser.error("--record can only be used with one process")
+
+    if args.processes <= 1:
+        run(token, log_options, shard_count=args.shards, metrics_port=metrics_port, **options)
+    else:
+        # each process runs every nth shard, and they share state through the store
+        processes = [
+            multiprocessing.Process(
+                target=run,
+                args=(token, log_options),
+                kwargs={
+                    **options,
+                    "shard_count": args.shards,
+                    "shard_ids": list(range(i, args.shards, args.processes)),
+                    "store_path": "data/state.sqlite3",
+                    "metrics_port": metrics_port + i if metrics_port is not None else None,
+                },
+                name=f"amadeus-{i}",
+            )
+            for i in range(min(args.processes, args.shards))
+        ]
+
+        for p in processes:
+            p.start()
+
+        # each process shuts itself down on a signal; pass SIGTERM on, and let them handle a ctrl-c themselves
+        signal.signal(signal.SIGTERM, lambda sig, frame: [p.terminate() for p in processes])
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+        for p in processes:
+            p.join()
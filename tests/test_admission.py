@@ -0,0 +1,83 @@
+import pytest
+
+from amadeus.admission import Buckets, Limit
+
+
+def test_new_key_starts_full():
+    buckets = Buckets(Limit(1, 3))
+
+    for _ in range(3):
+        assert buckets.peek("user", 0.0)
+        buckets.take("user", 0.0)
+
+    assert not buckets.peek("user", 0.0)
+
+
+def test_peek_takes_nothing():
+    buckets = Buckets(Limit(1, 1))
+
+    assert buckets.peek("user", 0.0)
+    assert buckets.peek("user", 0.0)
+
+    buckets.take("user", 0.0)
+    assert not buckets.peek("user", 0.0)
+
+
+def test_refill():
+    buckets = Buckets(Limit(0.5, 2))
+    buckets.take("user", 0.0)
+    buckets.take("user", 0.0)
+
+    assert not buckets.peek("user", 1.0)
+    assert buckets.peek("user", 2.0)
+    assert buckets.buckets["user"][0] == pytest.approx(1.0)
+
+
+def test_refill_stops_at_burst():
+    buckets = Buckets(Limit(10, 2))
+    buckets.take("user", 0.0)
+    buckets.peek("user", 100.0)
+
+    assert buckets.buckets["user"][0] == 2
+
+
+def test_take_can_go_into_debt():
+    buckets = Buckets(Limit(1, 1))
+    buckets.take("user", 0.0)
+    buckets.take("user", 0.0)
+
+    assert buckets.buckets["user"][0] == pytest.approx(-1.0)
+    assert not buckets.peek("user", 1.5)
+    assert buckets.peek("user", 2.0)
+
+
+def test_keys_are_separate():
+    buckets = Buckets(Limit(1, 1))
+    buckets.take("a", 0.0)
+
+    assert not buckets.peek("a", 0.0)
+    assert buckets.peek("b", 0.0)
+
+
+def test_prune_drops_only_full_buckets():
+    buckets = Buckets(Limit(1, 2))
+    buckets.take("idle", 0.0)
+    buckets.take("busy", 9.0)
+    buckets.take("busy", 9.0)
+
+    buckets.prune(10.0)
+
+    assert set(buckets.buckets) == {"busy"}
+
+
+def test_prunes_when_too_many():
+    buckets = Buckets(Limit(1, 1))
+    buckets.PRUNE_AT = 3
+
+    for key in "abc":
+        buckets.take(key, 0.0)
+
+    # by now a, b and c have refilled, so they go to make room for d
+    buckets.peek("d", 5.0)
+
+    assert set(buckets.buckets) == {"d"}
@@ -0,0 +1,86 @@
+import pytest
+
+from amadeus.metrics import Registry, _format_value
+
+
+def test_labelled_counter():
+    registry = Registry()
+    counter = registry.counter("amadeus_responses_fired_total", "Responses fired", ["response"])
+    counter.inc(response="hug")
+    counter.inc(response="hug")
+    counter.inc(3, response='say "hi"')
+
+    assert registry.expose().splitlines() == [
+        "# HELP amadeus_responses_fired_total Responses fired",
+        "# TYPE amadeus_responses_fired_total counter",
+        'amadeus_responses_fired_total{response="hug"} 2',
+        'amadeus_responses_fired_total{response="say \\"hi\\""} 3',
+    ]
+
+
+def test_histogram():
+    registry = Registry()
+    histogram = registry.histogram("amadeus_save_seconds", "Saves", buckets=(0.1, 1.0))
+    histogram.observe(0.05)
+    histogram.observe(0.5)
+    histogram.observe(2.5)
+
+    assert registry.expose().splitlines() == [
+        "# HELP amadeus_save_seconds Saves",
+        "# TYPE amadeus_save_seconds histogram",
+        'amadeus_save_seconds_bucket{le="0.1"} 1',
+        'amadeus_save_seconds_bucket{le="1"} 2',
+        'amadeus_save_seconds_bucket{le="+Inf"} 3',
+        "amadeus_save_seconds_sum 3.05",
+        "amadeus_save_seconds_count 3",
+    ]
+
+
+def test_labelled_histogram_buckets_are_cumulative():
+    registry = Registry()
+    histogram = registry.histogram("amadeus_command_seconds", "Commands", ["command"], buckets=(1.0, 2.0))
+    histogram.observe(0.5, command="ping")
+    histogram.observe(0.5, command="ping")
+    histogram.observe(1.5, command="ping")
+
+    assert registry.expose().splitlines()[2:] == [
+        'amadeus_command_seconds_bucket{command="ping",le="1"} 2',
+        'amadeus_command_seconds_bucket{command="ping",le="2"} 3',
+        'amadeus_command_seconds_bucket{command="ping",le="+Inf"} 3',
+        'amadeus_command_seconds_sum{command="ping"} 2.5',
+        'amadeus_command_seconds_count{command="ping"} 3',
+    ]
+
+
+def test_function_metrics():
+    registry = Registry()
+    registry.gauge("amadeus_guilds", "Guilds", function=lambda: 4)
+    registry.counter("amadeus_dropped_total", "Dropped", function=lambda: None)
+
+    assert registry.expose().splitlines() == [
+        "# HELP amadeus_guilds Guilds",
+        "# TYPE amadeus_guilds gauge",
+        "amadeus_guilds 4",
+        "# HELP amadeus_dropped_total Dropped",
+        "# TYPE amadeus_dropped_total counter",
+    ]
+
+
+@pytest.mark.parametrize("value, expected", [
+    (3, "3"),
+    (2.0, "2"),
+    (0.25, "0.25"),
+    (float("inf"), "+Inf"),
+    (float("-inf"), "-Inf"),
+])
+def test_format_value(value, expected):
+    assert _format_value(value) == expected
+
+
+def test_same_name_gives_the_same_metric():
+    registry = Registry()
+
+    assert registry.counter("amadeus_x_total") is registry.counter("amadeus_x_total")
+
+    with pytest.raises(ValueError):
+        registry.gauge("amadeus_x_total")
@@ -0,0 +1,63 @@
+import random
+from collections import Counter
+
+import pytest
+
+from amadeus.response.selection import AliasTable
+
+
+def frequencies(table, draws=100000, seed=0):
+    rng = random.Random(seed)
+    counts = Counter(table.pick(rng) for _ in range(draws))
+    return {item: n / draws for item, n in counts.items()}
+
+
+def test_weighted_distribution():
+    table = AliasTable(["a", "b", "c", "d"], [1, 2, 3, 4])
+    found = frequencies(table)
+
+    for item, expected in zip("abcd", [0.1, 0.2, 0.3, 0.4]):
+        assert found[item] == pytest.approx(expected, abs=0.01)
+
+
+def test_zero_weight_is_never_picked():
+    table = AliasTable(["a", "b", "c"], [0, 1, 3])
+    found = frequencies(table)
+
+    assert "a" not in found
+    assert found["b"] == pytest.approx(0.25, abs=0.01)
+    assert found["c"] == pytest.approx(0.75, abs=0.01)
+
+
+def test_equal_weights_are_uniform():
+    table = AliasTable(["a", "b", "c"], [2, 2, 2])
+    assert table.probability is None
+
+    for frequency in frequencies(table).values():
+        assert frequency == pytest.approx(1 / 3, abs=0.01)
+
+
+def test_same_seed_picks_the_same():
+    table = AliasTable(["a", "b", "c"], [5, 1, 1])
+
+    first = [table.pick(random.Random(42)) for _ in range(20)]
+    second = [table.pick(random.Random(42)) for _ in range(20)]
+
+    assert first == second
+
+
+@pytest.mark.parametrize("weights", [
+    [0, 0, 0],
+    [-1, -1, -1],
+    [1, -1, 2],
+    [0, 0],
+    [1],
+])
+def test_bad_weights_are_rejected(weights):
+    with pytest.raises(ValueError):
+        AliasTable(["a", "b", "c"], weights)
+
+
+def test_no_items_are_rejected():
+    with pytest.raises(ValueError):
+        AliasTable([])
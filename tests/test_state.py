@@ -0,0 +1,159 @@
+import json
+import pickle
+import struct
+
+import pytest
+
+from amadeus import state
+
+
+def write_raw(path, version, sections, magic=state.MAGIC):
+    """
+    Writes a snapshot by hand, with each section given as its raw payload.
+    """
+    with open(path, "wb") as f:
+        f.write(struct.pack(">4sH", magic, version))
+
+        for payload in sections:
+            f.write(struct.pack(">I", len(payload)))
+            f.write(payload)
+
+
+def json_section(name, data):
+    encoded_name = name.encode("utf8")
+    return struct.pack(">BB", state.JSON_SECTION, len(encoded_name)) + encoded_name + json.dumps(data).encode("utf8")
+
+
+SECTIONS = {
+    "responses_states": {"hug": "message"},
+    "responses_enabled": {"hug": True},
+    "click_db": {234387706463911939: 12, 1: 1},
+}
+
+
+def test_round_trip(tmp_path):
+    path = str(tmp_path / "data.state")
+    state.save(path, SECTIONS)
+
+    assert state.load(path) == SECTIONS
+
+
+def test_empty_click_db(tmp_path):
+    path = str(tmp_path / "data.state")
+    state.save(path, {"click_db": {}})
+
+    assert state.load(path) == {"click_db": {}}
+
+
+def test_migrates_version_1(tmp_path):
+    path = str(tmp_path / "data.state")
+    write_raw(path, 1, [
+        json.dumps(["responses_enabled", {"hug": False}]).encode("utf8"),
+        json.dumps(["click_db", {"234387706463911939": 3}]).encode("utf8"),
+    ])
+
+    assert state.load(path) == {"responses_enabled": {"hug": False}, "click_db": {234387706463911939: 3}}
+
+
+def test_bad_click_db_in_version_1_is_skipped(tmp_path):
+    path = str(tmp_path / "data.state")
+    write_raw(path, 1, [
+        json.dumps(["responses_enabled", {"hug": False}]).encode("utf8"),
+        json.dumps(["click_db", {"not an id": 3}]).encode("utf8"),
+    ])
+
+    assert state.load(path) == {"responses_enabled": {"hug": False}}
+
+
+@pytest.mark.parametrize("version", [0, state.VERSION + 1])
+def test_bad_version(tmp_path, version):
+    path = str(tmp_path / "data.state")
+    write_raw(path, version, [])
+
+    with pytest.raises(state.StateError):
+        state.load(path)
+
+
+def test_missing_migration(tmp_path, monkeypatch):
+    path = str(tmp_path / "data.state")
+    write_raw(path, 1, [])
+    monkeypatch.setattr(state, "MIGRATIONS", {})
+
+    with pytest.raises(state.StateError):
+        state.load(path)
+
+
+@pytest.mark.parametrize("contents", [b"", b"AMD", b"NOPE\x00\x02"])
+def test_bad_header(tmp_path, contents):
+    path = tmp_path / "data.state"
+    path.write_bytes(contents)
+
+    with pytest.raises(state.StateError):
+        state.load(str(path))
+
+
+@pytest.mark.parametrize("payload", [
+    b"not json",
+    json.dumps([["a"], 1]).encode("utf8"),
+    json.dumps([1, {}]).encode("utf8"),
+    json.dumps([None, {}]).encode("utf8"),
+    json.dumps(["a", 1, 2]).encode("utf8"),
+    json.dumps(5).encode("utf8"),
+])
+def test_corrupt_version_1_section_is_skipped(tmp_path, payload):
+    path = str(tmp_path / "data.state")
+    write_raw(path, 1, [payload, json.dumps(["responses_enabled", {"hug": True}]).encode("utf8")])
+
+    assert state.load(path) == {"responses_enabled": {"hug": True}}
+
+
+@pytest.mark.parametrize("payload", [
+    b"",
+    b"\x00",
+    b"\x07\x01a{}",
+    b"\x00\x05a{}",
+    b"\x00\x01a{",
+    struct.pack(">BB", state.TABLE_SECTION, 8) + b"click_db" + b"\x00" * 15,
+    struct.pack(">BB", state.JSON_SECTION, 2) + b"\xff\xfe{}",
+])
+def test_corrupt_section_is_skipped(tmp_path, payload):
+    path = str(tmp_path / "data.state")
+    write_raw(path, state.VERSION, [payload, json_section("responses_enabled", {"hug": True})])
+
+    assert state.load(path) == {"responses_enabled": {"hug": True}}
+
+
+@pytest.mark.parametrize("name, data", [
+    ("responses_states", {"hug": 1}),
+    ("responses_enabled", ["hug"]),
+    ("click_db", {"1": 1}),
+    ("click_db", {1: True}),
+    ("something else", {}),
+])
+def test_invalid_section_is_skipped(tmp_path, name, data):
+    path = str(tmp_path / "data.state")
+    write_raw(path, state.VERSION, [json_section(name, data), json_section("responses_enabled", {"hug": True})])
+
+    assert state.load(path) == {"responses_enabled": {"hug": True}}
+
+
+def test_truncated_section_keeps_earlier_sections(tmp_path):
+    path = tmp_path / "data.state"
+    state.save(str(path), SECTIONS)
+    path.write_bytes(path.read_bytes()[:-3])
+
+    loaded = state.load(str(path))
+
+    assert "click_db" not in loaded
+    assert loaded["responses_states"] == SECTIONS["responses_states"]
+
+
+def test_legacy_pickle(tmp_path):
+    path = tmp_path / "data.pickle"
+    path.write_bytes(pickle.dumps({
+        "responses_states": {"hug": "react"},
+        "responses_enabled": {"hug": "yes"},
+        "click_db": {1: 2},
+    }))
+
+    assert state.load_legacy_pickle(str(path)) == {"responses_states": {"hug": "react"}, "click_db": {1: 2}}